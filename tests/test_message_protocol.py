@@ -0,0 +1,66 @@
+"""
+Message Protocol Tests
+消息协议测试
+"""
+
+import pytest
+
+from token_manager.message_protocol import (
+    MessageValidationError,
+    create_token_upload_message,
+    decode_message,
+    validate_message,
+    validate_token_upload_payload
+)
+
+
+class TestMessageValidation:
+    """消息验证测试"""
+    
+    def test_valid_message(self):
+        """测试有效消息通过验证"""
+        message = create_token_upload_message("test_token_1234567890", "user_001")
+        
+        assert validate_message(message) is True
+        assert decode_message(message) is message
+    
+    @pytest.mark.parametrize("msg_type", [["token_upload"], {"type": "token_upload"}, 1, None])
+    def test_non_string_type_rejected(self, msg_type):
+        """测试非字符串type抛出验证错误而不是TypeError"""
+        message = {"type": msg_type, "timestamp": 0, "payload": {}}
+        
+        with pytest.raises(MessageValidationError):
+            validate_message(message)
+    
+    def test_unknown_type_rejected(self):
+        """测试未知消息类型被拒绝"""
+        message = {"type": "unknown", "timestamp": 0, "payload": {}}
+        
+        with pytest.raises(MessageValidationError):
+            validate_message(message)
+
+
+class TestTokenUploadPayload:
+    """Token上报payload验证测试"""
+    
+    def test_valid_source(self):
+        """测试有效来源通过验证"""
+        payload = create_token_upload_message("test_token_1234567890", "user_001")["payload"]
+        
+        assert validate_token_upload_payload(payload) is True
+    
+    @pytest.mark.parametrize("source", [["cookie"], {"source": "cookie"}, 1])
+    def test_non_string_source_rejected(self, source):
+        """测试非字符串source抛出验证错误而不是TypeError"""
+        payload = {"token": "test_token_1234567890", "userId": "user_001", "source": source}
+        
+        with pytest.raises(MessageValidationError):
+            validate_token_upload_payload(payload)
+    
+    def test_decode_rejects_non_string_source(self):
+        """测试decode_message对非字符串source返回验证错误"""
+        message = create_token_upload_message("test_token_1234567890", "user_001")
+        message["payload"]["source"] = {"bad": True}
+        
+        with pytest.raises(MessageValidationError):
+            decode_message(message)
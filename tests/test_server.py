@@ -4,13 +4,15 @@ FastAPI服务端点测试模块
 """
 
 import os
+import asyncio
 import pytest
+from unittest.mock import AsyncMock, patch
 from fastapi.testclient import TestClient
 
 # 设置测试数据库
 os.environ['TOKEN_DB_URL'] = 'sqlite:///test_server_api.db'
 
-from token_manager.server import app
+from token_manager.server import app, ProblemPieceBatcher
 from token_manager.token_service import reset_token_service
 from token_manager.websocket_manager import reset_websocket_manager
 from token_manager.models import close_database, init_database
@@ -149,6 +151,28 @@ class TestTokensAPI:
         response = client.get('/api/tokens/test_user_001')
         assert response.status_code == 404
     
+    def test_get_tokens_etag_not_modified(self, client):
+        """测试Token列表未变化时返回304"""
+        client.post('/api/tokens', json={
+            'token': 'test_token_value_12345678901234567890',
+            'user_id': 'test_user_001'
+        })
+        
+        response = client.get('/api/tokens')
+        etag = response.headers['etag']
+        
+        response = client.get('/api/tokens', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        
+        # 列表变化后ETag失效
+        client.post('/api/tokens', json={
+            'token': 'test_token_value_09876543210987654321',
+            'user_id': 'test_user_002'
+        })
+        response = client.get('/api/tokens', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['etag'] != etag
+    
     def test_delete_token_not_found(self, client):
         """测试删除不存在的Token"""
         response = client.delete('/api/tokens/9999')
@@ -322,3 +346,138 @@ class TestManagementRoutes:
         response = client.get('/management')
         # 应该返回HTML文件或404（如果静态文件不存在）
         assert response.status_code in [200, 404]
+
+
+class TestProblemPieceBatcher:
+    """问题件登记合并器测试"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_submits_share_one_batch(self):
+        """测试同一Token的并发登记被合并为一批，且结果按运单分发"""
+        async def fake_register(client, token_value, network_id, waybill_no, image_path):
+            return {"success": True, "waybill_no": waybill_no}
+        
+        upload = AsyncMock(return_value="img/path.png")
+        with patch('token_manager.server.upload_problem_piece_image', upload), \
+             patch('token_manager.server.post_problem_piece_registration', side_effect=fake_register):
+            batcher = ProblemPieceBatcher(max_batch=10, max_wait_ms=20)
+            results = await asyncio.gather(*[
+                batcher.submit(1, "token", 100, f"JT{i}") for i in range(5)
+            ])
+        
+        assert [r["waybill_no"] for r in results] == [f"JT{i}" for i in range(5)]
+        # 整批只上传一次图片
+        assert upload.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_immediately(self):
+        """测试批次达到上限时立即提交，不等待合并窗口"""
+        async def fake_register(client, token_value, network_id, waybill_no, image_path):
+            return {"success": True, "waybill_no": waybill_no}
+        
+        with patch('token_manager.server.upload_problem_piece_image', AsyncMock(return_value=None)), \
+             patch('token_manager.server.post_problem_piece_registration', side_effect=fake_register):
+            batcher = ProblemPieceBatcher(max_batch=2, max_wait_ms=10000)
+            results = await asyncio.wait_for(asyncio.gather(
+                batcher.submit(1, "token", 100, "JT1"),
+                batcher.submit(1, "token", 100, "JT2"),
+            ), timeout=1)
+        
+        assert len(results) == 2
+    
+    @pytest.mark.asyncio
+    async def test_single_submit_not_delayed(self):
+        """测试没有在途批次时单个请求立即提交，且后台任务结束后不再被引用"""
+        async def fake_register(client, token_value, network_id, waybill_no, image_path):
+            return {"success": True, "waybill_no": waybill_no}
+        
+        with patch('token_manager.server.upload_problem_piece_image', AsyncMock(return_value=None)), \
+             patch('token_manager.server.post_problem_piece_registration', side_effect=fake_register):
+            batcher = ProblemPieceBatcher(max_batch=10, max_wait_ms=10000)
+            result = await asyncio.wait_for(batcher.submit(1, "token", 100, "JT1"), timeout=1)
+            await asyncio.sleep(0)
+        
+        assert result["waybill_no"] == "JT1"
+        assert not batcher._tasks
+        assert not batcher._inflight
+
+
+class TestProblemPieceListCache:
+    """问题件列表缓存测试"""
+    
+    def _create_network_token(self):
+        from token_manager.token_service import get_token_service
+        token = get_token_service().create_or_update(
+            token='network_token_12345678901234567890',
+            user_id='network_user_001',
+            account_type='network',
+            network_code='350001',
+            network_name='测试网点',
+            network_id=1001
+        )
+        return token.id
+    
+    def test_repeated_refresh_hits_cache(self, client):
+        """测试同一Token同一日期的重复刷新只拉取一次上游"""
+        from token_manager import server
+        server._problem_piece_list_cache.clear()
+        token_id = self._create_network_token()
+        
+        payload = {"success": True, "date": "2024-01-01", "total": 0}
+        fetch = AsyncMock(return_value=payload)
+        with patch('token_manager.server.fetch_problem_piece_list', fetch):
+            for _ in range(3):
+                response = client.post(f'/api/problem-piece/{token_id}/list', json={'date': '2024-01-01'})
+                assert response.status_code == 200
+                assert response.json() == payload
+            
+            # 登记成功后缓存失效
+            server.invalidate_problem_piece_list_cache(token_id)
+            client.post(f'/api/problem-piece/{token_id}/list', json={'date': '2024-01-01'})
+        
+        assert fetch.await_count == 2
+    
+    def test_cache_bounded_and_stale_dropped(self):
+        """测试缓存容量受限，过期条目在读取时删除"""
+        from token_manager import server
+        server._problem_piece_list_cache.clear()
+        
+        with patch.object(server, 'PROBLEM_PIECE_LIST_CACHE_MAXSIZE', 2):
+            server._set_cached_problem_piece_list((1, "a"), {"n": 1})
+            server._set_cached_problem_piece_list((1, "b"), {"n": 2})
+            # 访问a使其成为最近使用
+            assert server._get_cached_problem_piece_list((1, "a")) == {"n": 1}
+            server._set_cached_problem_piece_list((1, "c"), {"n": 3})
+        
+        assert list(server._problem_piece_list_cache) == [(1, "a"), (1, "c")]
+        
+        server._problem_piece_list_cache[(1, "a")] = (0.0, {"n": 1})
+        assert server._get_cached_problem_piece_list((1, "a")) is None
+        assert (1, "a") not in server._problem_piece_list_cache
+        server._problem_piece_list_cache.clear()
+    
+    @pytest.mark.asyncio
+    async def test_lock_released_after_last_user(self):
+        """测试锁在最后一个使用者退出后移除，失效缓存不影响正在使用的锁"""
+        from token_manager import server
+        key = (1, "2024-01-01")
+        entered = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def holder():
+            async with server._problem_piece_list_lock(key):
+                entered.set()
+                await release.wait()
+        
+        task = asyncio.create_task(holder())
+        await entered.wait()
+        lock = server._problem_piece_list_locks[key][0]
+        
+        server.invalidate_problem_piece_list_cache(1)
+        waiter = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        assert server._problem_piece_list_locks[key][0] is lock
+        
+        release.set()
+        await asyncio.gather(task, waiter)
+        assert key not in server._problem_piece_list_locks
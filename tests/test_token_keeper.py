@@ -3,16 +3,21 @@ Token Keeper Tests
 Token保活服务测试
 """
 
+import json
+import time
 import pytest
 import asyncio
+import httpx
 from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 
 from token_manager.token_keeper import (
     TokenKeeper,
     TokenKeeperError,
+    TransientCheckError,
     get_token_keeper,
-    reset_token_keeper
+    reset_token_keeper,
+    _decrypt_many
 )
 from token_manager.models import Token, TokenStatus, init_database, get_db_session, close_database
 from token_manager.token_service import TokenService, reset_token_service
@@ -99,6 +104,46 @@ class TestTokenKeeperInit:
         keeper.set_interval(120)
         assert keeper.interval == 120
     
+    def test_adapt_interval(self):
+        """测试保活间隔自适应调整"""
+        keeper = TokenKeeper(interval_seconds=300, min_interval=60, max_interval=600)
+        
+        # 出现失效时间隔减半
+        assert keeper.adapt_interval({"expired": 1}) == 150
+        
+        # 连续3轮无失效后放宽1.5倍
+        assert keeper.adapt_interval({"expired": 0}) == 150
+        assert keeper.adapt_interval({"expired": 0}) == 150
+        assert keeper.adapt_interval({"expired": 0}) == 225
+        
+        # 不超出上下限
+        for _ in range(10):
+            keeper.adapt_interval({"expired": 2})
+        assert keeper.interval == 60
+        for _ in range(30):
+            keeper.adapt_interval({"expired": 0})
+        assert keeper.interval == 600
+    
+    def test_set_interval_caps_adaptation(self):
+        """测试显式设置的间隔作为自适应调整的上限"""
+        keeper = TokenKeeper(interval_seconds=300, min_interval=60, max_interval=1800)
+        keeper.set_interval(200)
+        
+        # 稳定期不会放宽到超过设置值
+        for _ in range(30):
+            keeper.adapt_interval({"expired": 0})
+        assert keeper.interval == 200
+        
+        # 出现失效时仍可缩短，稳定后恢复到设置值
+        assert keeper.adapt_interval({"expired": 1}) == 100
+        for _ in range(30):
+            keeper.adapt_interval({"expired": 0})
+        assert keeper.interval == 200
+        
+        # 设置值低于下限时下限随之降低，不会被调高
+        keeper.set_interval(30)
+        assert keeper.adapt_interval({"expired": 1}) == 30
+    
     def test_reset_stats(self):
         """测试重置统计"""
         keeper = TokenKeeper()
@@ -126,6 +171,33 @@ class TestTokenKeeperStartStop:
         await keeper.stop()
         assert not keeper.is_running
     
+    @pytest.mark.asyncio
+    async def test_stop_wakes_waiting_loop(self):
+        """测试停止时等待中的循环立即退出而不是被取消"""
+        keeper = TokenKeeper(interval_seconds=300)
+        
+        await keeper.start()
+        await asyncio.sleep(0.01)
+        task = keeper._task
+        
+        await asyncio.wait_for(keeper.stop(), timeout=0.5)
+        assert task.done()
+        assert not task.cancelled()
+    
+    @pytest.mark.asyncio
+    async def test_set_interval_applies_immediately(self):
+        """测试调整间隔后按新间隔重新计时"""
+        keeper = TokenKeeper(interval_seconds=300)
+        
+        with patch.object(keeper, "run_keep_alive_cycle", AsyncMock(return_value={"expired": 0})) as cycle:
+            await keeper.start()
+            await asyncio.sleep(0.01)
+            keeper.set_interval(0)
+            await asyncio.sleep(0.05)
+            await keeper.stop()
+        
+        assert cycle.await_count >= 1
+    
     @pytest.mark.asyncio
     async def test_double_start(self):
         """测试重复启动"""
@@ -199,6 +271,15 @@ class TestCheckTokenValidity:
         
         # 服务器错误不应该导致Token被标记为失效
         assert result is True
+    
+    @pytest.mark.asyncio
+    async def test_timeout_raises_transient_error(self, mock_http_client):
+        """测试请求超时抛出临时失败异常"""
+        mock_http_client.get = AsyncMock(side_effect=httpx.ConnectTimeout("timeout"))
+        
+        keeper = TokenKeeper(http_client=mock_http_client)
+        with pytest.raises(TransientCheckError):
+            await keeper.check_token_validity("some_token")
 
 
 class TestKeepAlive:
@@ -303,6 +384,151 @@ class TestRunKeepAliveCycle:
         assert result["total"] == 2
         assert result["success"] == 2
         assert result["expired"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_cycle_concurrency_bounded(self, token_service, mock_http_client):
+        """测试保活并发数不超过上限，单个异常计入失败"""
+        for i in range(5):
+            token_service.create_or_update(
+                token=f"test_token_{i}_12345678901234567890",
+                user_id=f"test_user_{i}"
+            )
+        
+        keeper = TokenKeeper(
+            token_service=token_service,
+            http_client=mock_http_client,
+            concurrency=2
+        )
+        
+        in_flight = 0
+        max_in_flight = 0
+        
+        async def fake_probe(token, account_type):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if token.startswith("test_token_0_"):
+                raise RuntimeError("boom")
+            return True
+        
+        with patch.object(keeper, "probe_token", side_effect=fake_probe):
+            result = await keeper.run_keep_alive_cycle()
+        
+        assert max_in_flight == 2
+        assert result["total"] == 5
+        assert result["success"] == 4
+        assert result["failed"] == 1
+
+
+class TestVerifyCache:
+    """有效性校验缓存测试"""
+    
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_probe(self, mock_http_client):
+        """测试TTL内重复校验不再发起请求"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        with patch.object(keeper, "probe_token", AsyncMock(return_value=True)) as probe:
+            assert await keeper.verify_token(1, "test_token") is True
+            assert await keeper.verify_token(1, "test_token") is True
+            assert probe.await_count == 1
+            assert keeper.stats["cache_hits"] == 1
+            
+            keeper.reset_verify_cache()
+            assert await keeper.verify_token(1, "test_token") is True
+            assert probe.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_checks_deduplicated(self, mock_http_client):
+        """测试同一Token的并发校验只发起一次请求"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        async def slow_probe(token, account_type):
+            await asyncio.sleep(0.01)
+            return True
+        
+        with patch.object(keeper, "probe_token", AsyncMock(side_effect=slow_probe)) as probe:
+            results = await asyncio.gather(*[keeper.verify_token(1, "test_token") for _ in range(5)])
+        
+        assert results == [True] * 5
+        assert probe.await_count == 1
+        
+        keeper.reset_verify_cache()
+        assert not keeper._verify_locks
+    
+    @pytest.mark.asyncio
+    async def test_transient_error_keeps_previous_verdict(self, mock_http_client):
+        """测试请求临时失败时沿用结果且不刷新缓存"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        with patch.object(keeper, "probe_token", AsyncMock(side_effect=TransientCheckError("timeout"))):
+            # 无历史记录时保守视为有效，但不写缓存
+            assert await keeper.verify_token(1, "test_token") is True
+            assert 1 not in keeper._verify_cache
+        
+        stale = ("test_token", True, time.monotonic() - 3600)  # 已过期的历史记录
+        keeper._verify_cache[2] = stale
+        with patch.object(keeper, "probe_token", AsyncMock(side_effect=TransientCheckError("timeout"))):
+            assert await keeper.verify_token(2, "test_token") is True
+            assert keeper._verify_cache[2] == stale
+    
+    @pytest.mark.asyncio
+    async def test_transient_error_keeps_invalid_verdict(self, mock_http_client):
+        """测试请求临时失败时沿用同一Token值上次的无效结果"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        with patch.object(keeper, "probe_token", AsyncMock(return_value=False)):
+            assert await keeper.verify_token(1, "test_token") is False
+        
+        with patch.object(keeper, "probe_token", AsyncMock(side_effect=TransientCheckError("timeout"))):
+            assert await keeper.verify_token(1, "test_token") is False
+            # Token已被重新上传，旧结果不适用
+            assert await keeper.verify_token(1, "new_token_value") is True
+    
+    @pytest.mark.asyncio
+    async def test_reuploaded_token_not_served_from_cache(self, mock_http_client):
+        """测试Token值变化后不复用旧值的校验通过记录"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        with patch.object(keeper, "probe_token", AsyncMock(return_value=True)):
+            assert await keeper.verify_token(1, "test_token") is True
+        
+        with patch.object(keeper, "probe_token", AsyncMock(return_value=False)) as probe:
+            assert await keeper.verify_token(1, "new_token_value") is False
+            assert probe.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_invalid_result_not_reused(self, mock_http_client):
+        """测试无效结果不在TTL内直接复用"""
+        keeper = TokenKeeper(interval_seconds=300, http_client=mock_http_client)
+        
+        with patch.object(keeper, "probe_token", AsyncMock(return_value=False)) as probe:
+            assert await keeper.verify_token(1, "test_token") is False
+            assert await keeper.verify_token(1, "test_token") is False
+            assert probe.await_count == 2
+            assert keeper.stats["cache_hits"] == 0
+
+
+class TestDecryptCache:
+    """解密结果缓存测试"""
+    
+    @pytest.mark.asyncio
+    async def test_decrypt_reuses_cached_plaintext(self, mock_http_client):
+        """测试相同密文只解密一次，解密失败不影响其他Token"""
+        keeper = TokenKeeper(http_client=mock_http_client)
+        encrypted = encrypt_token("test_token_12345678901234567890")
+        
+        with patch("token_manager.token_keeper._decrypt_many", wraps=_decrypt_many) as decrypt_many:
+            first = await keeper._decrypt_tokens([encrypted, encrypted, "invalid"])
+            second = await keeper._decrypt_tokens([encrypted])
+        
+        assert first[0] == first[1] == "test_token_12345678901234567890"
+        assert isinstance(first[2], Exception)
+        assert second == ["test_token_12345678901234567890"]
+        assert decrypt_many.call_count == 1
+        assert decrypt_many.call_args[0][0] == [encrypted, "invalid"]
 
 
 class TestNotifyTokenExpired:
@@ -333,6 +559,28 @@ class TestNotifyTokenExpired:
         
         assert result is True
         mock_manager.send_to_extension.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_notify_expired_users(self, websocket_manager):
+        """测试批量通知只查找一次连接，并对已连接用户并发发送"""
+        websocket = AsyncMock()
+        websocket_manager.register_accepted(websocket, "ext_123")
+        websocket_manager.set_user_id("ext_123", "user_1")
+        
+        keeper = TokenKeeper(websocket_manager=websocket_manager)
+        
+        with patch.object(
+            websocket_manager, "get_connection_by_user", wraps=websocket_manager.get_connection_by_user
+        ) as lookup:
+            result = await keeper.notify_expired_users(["user_1", "user_2"], "Token已过期")
+        
+        assert result == 1
+        lookup.assert_not_called()
+        websocket.send_text.assert_awaited_once()
+        
+        sent = json.loads(websocket.send_text.await_args[0][0])
+        assert sent["type"] == "token_expired"
+        assert sent["payload"] == {"userId": "user_1", "reason": "Token已过期"}
 
 
 class TestGlobalInstance:
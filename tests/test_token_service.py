@@ -8,10 +8,12 @@ import os
 import tempfile
 from datetime import datetime
 
+from sqlalchemy import update
+
 # 设置测试数据库
 os.environ["TOKEN_DB_URL"] = "sqlite:///:memory:"
 
-from token_manager.models import init_database, close_database, TokenStatus, Base, get_engine
+from token_manager.models import init_database, close_database, TokenStatus, Base, Token
 from token_manager.token_service import (
     TokenService, 
     TokenValidationError, 
@@ -54,6 +56,32 @@ class TestTokenServiceBasic:
         finally:
             service.close()
     
+    def test_create_token_expires_other_objects(self):
+        """测试创建Token提交后，会话中其他对象仍按提交过期，读取到最新值"""
+        service = TokenService()
+        try:
+            other = service.create_or_update(
+                token="test_token_12345678901234567890",
+                user_id="user_other"
+            )
+            assert other.status == TokenStatus.ACTIVE
+            
+            # 绕过ORM修改已加载对象对应的行
+            service.session.execute(
+                update(Token).where(Token.id == other.id).values(status=TokenStatus.EXPIRED),
+                execution_options={"synchronize_session": False}
+            )
+            
+            token = service.create_or_update(
+                token="test_token_09876543210987654321",
+                user_id="user_reload"
+            )
+            assert token.id is not None
+            assert token.user_id == "user_reload"
+            assert other.status == TokenStatus.EXPIRED
+        finally:
+            service.close()
+    
     def test_create_token_with_extension_id(self):
         """测试创建带extension_id的Token"""
         service = TokenService()
@@ -193,6 +221,57 @@ class TestTokenServiceBasic:
             assert token.last_active_at is not None
         finally:
             service.close()
+    
+    def test_bulk_touch(self):
+        """测试批量写回保活结果"""
+        service = TokenService()
+        try:
+            active = service.create_or_update(
+                token="test_token_12345678901234567890",
+                user_id="user008"
+            )
+            expired = service.create_or_update(
+                token="test_token_09876543210987654321",
+                user_id="user009"
+            )
+            
+            affected = service.bulk_touch([active.id], [(expired.id, expired.token_value)])
+            assert affected == 2
+            
+            active = service.get_by_id(active.id)
+            expired = service.get_by_id(expired.id)
+            assert active.last_active_at is not None
+            assert active.status == TokenStatus.ACTIVE
+            assert expired.status == TokenStatus.EXPIRED
+            
+            # 空列表不执行任何语句
+            assert service.bulk_touch([], []) == 0
+        finally:
+            service.close()
+    
+    def test_bulk_touch_skips_reuploaded_token(self):
+        """测试检测期间被重新上传的Token不会被标记为过期"""
+        service = TokenService()
+        try:
+            token = service.create_or_update(
+                token="test_token_12345678901234567890",
+                user_id="user010",
+                account="user010"
+            )
+            probed_value = token.token_value
+            
+            # 检测期间用户重新上传了Token
+            service.create_or_update(
+                token="test_token_reuploaded_1234567890",
+                user_id="user010",
+                account="user010"
+            )
+            
+            affected = service.bulk_touch([], [(token.id, probed_value)])
+            assert affected == 0
+            assert service.get_by_id(token.id).status == TokenStatus.ACTIVE
+        finally:
+            service.close()
 
 
 class TestTokenValidation:
@@ -261,6 +340,25 @@ class TestDatabaseOperations:
         finally:
             service2.close()
     
+    def test_get_by_status(self):
+        """测试按状态获取Token"""
+        service = TokenService()
+        try:
+            active = service.create_or_update(
+                token="test_token_12345678901234567890",
+                user_id="status_user_1"
+            )
+            expired = service.create_or_update(
+                token="test_token_09876543210987654321",
+                user_id="status_user_2"
+            )
+            service.update_status(expired.id, TokenStatus.EXPIRED)
+            
+            assert [t.id for t in service.get_by_status(TokenStatus.EXPIRED)] == [expired.id]
+            assert [t.id for t in service.get_by_status(TokenStatus.ACTIVE)] == [active.id]
+        finally:
+            service.close()
+    
     def test_get_active_tokens(self):
         """测试获取活跃Token"""
         service = TokenService()
@@ -284,3 +382,25 @@ class TestDatabaseOperations:
             assert active_tokens[0].user_id == "active_user"
         finally:
             service.close()
+    
+    def test_iter_active_for_keeper(self):
+        """测试保活用的精简活跃Token查询"""
+        service = TokenService()
+        try:
+            token = service.create_or_update(
+                token="active_token_1234567890",
+                user_id="active_user"
+            )
+            expired = service.create_or_update(
+                token="expired_token_1234567890",
+                user_id="expired_user"
+            )
+            service.update_status(expired.id, TokenStatus.EXPIRED)
+            
+            rows = list(service.iter_active_for_keeper())
+            assert len(rows) == 1
+            assert rows[0].id == token.id
+            assert rows[0].user_id == "active_user"
+            assert rows[0].token_value == token.token_value
+        finally:
+            service.close()
@@ -8,8 +8,11 @@ import pytest
 from token_manager.validators import (
     validate_token,
     is_valid_token,
+    validate_tokens,
     validate_user_id,
     is_valid_user_id,
+    clear_validation_cache,
+    _validate_token_impl,
     MIN_TOKEN_LENGTH,
     MAX_TOKEN_LENGTH
 )
@@ -89,6 +92,43 @@ class TestTokenValidation:
         assert is_valid_token("valid_token_1234567890") is True
         assert is_valid_token("") is False
         assert is_valid_token("short") is False
+    
+    def test_repeated_validation_cached(self):
+        """测试重复验证命中缓存，超长输入不进入缓存"""
+        clear_validation_cache()
+        
+        validate_token("valid_token_1234567890")
+        validate_token("valid_token_1234567890")
+        info = _validate_token_impl.cache_info()
+        assert info.hits == 1
+        assert info.currsize == 1
+        
+        valid, msg = validate_token("a" * (MAX_TOKEN_LENGTH * 4))
+        assert valid is False
+        assert _validate_token_impl.cache_info().currsize == 1
+        
+        clear_validation_cache()
+        assert _validate_token_impl.cache_info().currsize == 0
+    
+    def test_validate_tokens_matches_single(self):
+        """测试批量验证结果与逐个验证一致"""
+        tokens = [
+            "valid_token_1234567890",
+            "  padded_token_1234567890\t",
+            "",
+            "   ",
+            None,
+            "short",
+            "a" * MIN_TOKEN_LENGTH,
+            "a" * MAX_TOKEN_LENGTH,
+            "a" * (MAX_TOKEN_LENGTH + 1),
+            "token@with#invalid$chars",
+            "token_with_é_unicode",
+            "abc+def/ghi=jkl.mno-pqr",
+        ]
+        
+        assert validate_tokens(tokens) == [is_valid_token(t) for t in tokens]
+        assert validate_tokens([]) == []
 
 
 class TestUserIdValidation:
@@ -23,7 +23,8 @@ from .message_protocol import (
     create_token_expired_message,
     create_error_message,
     parse_message,
-    validate_message
+    validate_message,
+    decode_message
 )
 from .main import TokenManagerService, run_server
 
@@ -67,6 +68,7 @@ __all__ = [
     "create_error_message",
     "parse_message",
     "validate_message",
+    "decode_message",
     # 服务入口
     "TokenManagerService",
     "run_server",
@@ -41,6 +41,9 @@ WS_RECONNECT_INTERVAL = int(os.getenv("WS_RECONNECT_INTERVAL", "5"))  # 秒
 
 # Token保活配置
 KEEP_ALIVE_INTERVAL = int(os.getenv("KEEP_ALIVE_INTERVAL", "300"))  # 秒，默认5分钟
+KEEP_ALIVE_CONCURRENCY = int(os.getenv("KEEP_ALIVE_CONCURRENCY", "16"))  # 单轮保活最大并发请求数
+KEEP_ALIVE_MIN_INTERVAL = int(os.getenv("KEEP_ALIVE_MIN_INTERVAL", "60"))  # 自适应保活间隔下限（秒）
+KEEP_ALIVE_MAX_INTERVAL = int(os.getenv("KEEP_ALIVE_MAX_INTERVAL", "1800"))  # 自适应保活间隔上限（秒）
 
 # 加密配置
 TOKEN_ENCRYPT_KEY = os.getenv("TOKEN_ENCRYPT_KEY", None)
@@ -10,13 +10,14 @@ WebSocket消息协议处理模块
 Requirements: 7.2
 """
 
-import json
 import logging
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Optional, TypedDict, Union
 from dataclasses import dataclass, asdict
 
+import orjson
+
 from .config import get_china_now
 
 # 配置日志
@@ -50,6 +51,34 @@ class TokenSource(str, Enum):
     LOCAL_STORAGE = "localStorage"
 
 
+# 合法取值集合（导入时构建一次，供逐帧校验使用）
+VALID_MESSAGE_TYPES = frozenset(t.value for t in MessageType)
+VALID_TOKEN_SOURCES = frozenset(s.value for s in TokenSource)
+
+
+class RegisterPayload(TypedDict, total=False):
+    """注册消息payload"""
+    extensionId: str
+    version: str
+
+
+class TokenUploadPayload(TypedDict, total=False):
+    """Token上报消息payload"""
+    token: str
+    userId: str
+    source: str
+    account: Optional[str]
+    accountType: Optional[str]
+    networkCode: Optional[str]
+    networkName: Optional[str]
+    networkId: Optional[int]
+
+
+class HeartbeatPayload(TypedDict, total=False):
+    """心跳消息payload"""
+    extensionId: str
+
+
 @dataclass
 class BaseMessage:
     """
@@ -71,7 +100,7 @@ class BaseMessage:
     
     def to_json(self) -> str:
         """转换为JSON字符串"""
-        return json.dumps(self.to_dict(), ensure_ascii=False)
+        return serialize_message(self.to_dict())
 
 
 def get_timestamp() -> int:
@@ -334,11 +363,9 @@ def parse_message(data: Union[str, bytes, Dict]) -> Dict[str, Any]:
         if isinstance(data, dict):
             return data
         
-        if isinstance(data, bytes):
-            data = data.decode('utf-8')
-        
-        return json.loads(data)
-    except json.JSONDecodeError as e:
+        # orjson直接接受str和bytes
+        return orjson.loads(data)
+    except orjson.JSONDecodeError as e:
         logger.error(f"消息JSON解析失败: {str(e)}")
         raise MessageParseError(f"无效的JSON格式: {str(e)}")
     except Exception as e:
@@ -373,8 +400,8 @@ def validate_message(message: Dict[str, Any]) -> bool:
     
     # 检查类型是否有效
     msg_type = message["type"]
-    valid_types = [t.value for t in MessageType]
-    if msg_type not in valid_types:
+    # 非字符串（如列表、对象）不可哈希，先检查类型再查集合
+    if not isinstance(msg_type, str) or msg_type not in VALID_MESSAGE_TYPES:
         raise MessageValidationError(f"无效的消息类型: {msg_type}")
     
     return True
@@ -426,8 +453,8 @@ def validate_token_upload_payload(payload: Dict[str, Any]) -> bool:
     
     # 验证source（可选）
     if "source" in payload:
-        valid_sources = [s.value for s in TokenSource]
-        if payload["source"] not in valid_sources:
+        source = payload["source"]
+        if not isinstance(source, str) or source not in VALID_TOKEN_SOURCES:
             raise MessageValidationError(f"无效的Token来源: {payload['source']}")
     
     return True
@@ -452,6 +479,48 @@ def validate_heartbeat_payload(payload: Dict[str, Any]) -> bool:
     return True
 
 
+# 插件发往服务器的消息类型 -> payload验证函数
+PAYLOAD_VALIDATORS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    MessageType.REGISTER.value: validate_register_payload,
+    MessageType.TOKEN_UPLOAD.value: validate_token_upload_payload,
+    MessageType.HEARTBEAT.value: validate_heartbeat_payload,
+}
+
+
+def decode_message(data: Union[str, bytes, Dict]) -> Dict[str, Any]:
+    """
+    解析并验证一条插件消息
+    
+    依次完成JSON解析、消息格式验证和对应类型的payload验证，
+    调用方拿到的消息可直接按类型使用payload字段。
+    
+    Args:
+        data: 原始消息数据（JSON字符串、字节或字典）
+        
+    Returns:
+        Dict: 已验证的消息字典
+        
+    Raises:
+        MessageParseError: 解析失败
+        MessageValidationError: 验证失败
+    """
+    message = parse_message(data)
+    if not isinstance(message, dict):
+        raise MessageValidationError("消息必须是JSON对象")
+    
+    validate_message(message)
+    
+    payload = message["payload"]
+    if not isinstance(payload, dict):
+        raise MessageValidationError("payload必须是JSON对象")
+    
+    validator = PAYLOAD_VALIDATORS.get(message["type"])
+    if validator is not None:
+        validator(payload)
+    
+    return message
+
+
 def get_message_type(message: Dict[str, Any]) -> Optional[MessageType]:
     """
     获取消息类型
@@ -482,7 +551,50 @@ def serialize_message(message: Dict[str, Any]) -> str:
     Returns:
         str: JSON字符串
     """
-    return json.dumps(message, ensure_ascii=False)
+    return orjson.dumps(message).decode()
+
+
+# 心跳确认帧除时间戳外固定不变，预先序列化前后两段
+_HEARTBEAT_ACK_PREFIX = '{"type":' + serialize_message(MessageType.HEARTBEAT_ACK.value) + ',"timestamp":'
+_HEARTBEAT_ACK_SUFFIX = ',"payload":{}}'
+
+
+def serialize_heartbeat_ack_message() -> str:
+    """
+    序列化心跳确认消息
+    
+    与serialize_message(create_heartbeat_ack_message())结果相同，但只拼接时间戳
+    
+    Returns:
+        str: JSON字符串
+    """
+    return f"{_HEARTBEAT_ACK_PREFIX}{get_timestamp()}{_HEARTBEAT_ACK_SUFFIX}"
+
+
+# Token失效通知模板中userId的占位值
+_USER_ID_PLACEHOLDER = "{USER_ID}"
+_USER_ID_PLACEHOLDER_JSON = serialize_message(_USER_ID_PLACEHOLDER)
+
+
+def serialize_token_expired_messages(user_ids: Iterable[str], reason: str = "Token已过期") -> Dict[str, str]:
+    """
+    批量序列化Token失效通知消息
+    
+    类型、时间戳和原因只序列化一次，再逐个填入userId；单条结果与
+    serialize_message(create_token_expired_message(user_id, reason))相同
+    
+    Args:
+        user_ids: 用户标识集合
+        reason: 失效原因
+        
+    Returns:
+        Dict[str, str]: 用户ID到JSON字符串的映射
+    """
+    template = serialize_message(create_token_expired_message(_USER_ID_PLACEHOLDER, reason))
+    return {
+        user_id: template.replace(_USER_ID_PLACEHOLDER_JSON, serialize_message(user_id))
+        for user_id in user_ids
+    }
 
 
 def deserialize_message(data: str) -> Dict[str, Any]:
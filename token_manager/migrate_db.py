@@ -1,6 +1,6 @@
 """
 数据库迁移脚本
-在现有数据库上添加 account_type 和网点信息字段
+在现有数据库上添加 account_type 和网点信息字段，以及 status 索引
 """
 import sqlite3
 from pathlib import Path
@@ -10,7 +10,7 @@ DB_PATH = Path(__file__).parent.parent / "token_data" / "tokens.db"
 
 
 def migrate():
-    """执行迁移：添加 account_type 和网点信息字段"""
+    """执行迁移：添加 account_type 和网点信息字段，以及 status 索引"""
     if not DB_PATH.exists():
         print(f"[迁移] 数据库不存在: {DB_PATH}")
         return False
@@ -70,6 +70,12 @@ def migrate():
         else:
             print("[迁移] network_id 字段已存在")
         
+        # 迁移5: 为 status 字段添加索引（按状态筛选Token）
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_tokens_status ON tokens (status)
+        """)
+        print("[迁移] status 索引已就绪")
+        
         conn.commit()
         print("[迁移] 所有迁移完成！")
         return True
@@ -38,7 +38,7 @@ class Token(Base):
     account = Column(String(64), nullable=True)  # 登录账号
     account_type = Column(Enum(AccountType), default=AccountType.AGENT)  # 账号类型
     token_value = Column(String(512), nullable=False)  # 加密存储
-    status = Column(Enum(TokenStatus), default=TokenStatus.ACTIVE)
+    status = Column(Enum(TokenStatus), default=TokenStatus.ACTIVE, index=True)
     extension_id = Column(String(64), nullable=True)
     # 网点信息（仅网点账号有）
     network_code = Column(String(64), nullable=True)  # 网点编码
@@ -112,7 +112,16 @@ def get_engine():
                 echo=False
             )
         else:
-            _engine = create_engine(DATABASE_URL, echo=False)
+            # 连接池按保活并发规模配置；写操作集中在保活循环中，连接失效会
+            # 立即以异常形式暴露，因此不启用每次取连接都SELECT 1的pool_pre_ping
+            _engine = create_engine(
+                DATABASE_URL,
+                pool_size=32,
+                max_overflow=32,
+                pool_recycle=3600,
+                pool_pre_ping=False,
+                echo=False
+            )
     return _engine
 
 
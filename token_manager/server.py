@@ -12,16 +12,26 @@ Requirements: 3.5, 4.1, 4.3, 4.4, 7.1, 9.1
 """
 
 import asyncio
+import hashlib
+import hmac
 import logging
-from typing import Optional, List
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import Enum
+from operator import attrgetter
+from typing import Optional, List, Dict, Tuple, Iterable
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ConfigDict, Field
 
 from .config import SERVER_HOST, SERVER_PORT, MANAGEMENT_PASSWORD, get_china_now
 from .token_service import (
@@ -34,29 +44,29 @@ from .token_service import (
 from .websocket_manager import WebSocketManager, get_websocket_manager
 from .message_protocol import (
     MessageType,
-    parse_message,
-    validate_message,
-    validate_register_payload,
-    validate_token_upload_payload,
-    validate_heartbeat_payload,
+    TokenUploadPayload,
+    HeartbeatPayload,
+    decode_message,
     create_register_ack_message,
     create_token_ack_message,
-    create_heartbeat_ack_message,
     create_error_message,
+    serialize_message,
+    serialize_heartbeat_ack_message,
     MessageParseError,
     MessageValidationError
 )
 from .crypto_utils import mask_token, decrypt_token
-from .models import TokenStatus
+from .models import TokenStatus, AccountType
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 创建FastAPI应用
+# 创建FastAPI应用（默认使用orjson序列化响应）
 app = FastAPI(
     title="Token Manager API",
     description="JMS平台Token管理服务API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 
@@ -73,6 +83,8 @@ class TokenCreate(BaseModel):
 
 class TokenResponse(BaseModel):
     """Token响应模型"""
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     user_id: str
     account: Optional[str]  # 登录账号
@@ -86,9 +98,6 @@ class TokenResponse(BaseModel):
     created_at: Optional[str]
     updated_at: Optional[str]
     last_active_at: Optional[str]
-    
-    class Config:
-        from_attributes = True
 
 
 class TokenListResponse(BaseModel):
@@ -111,10 +120,14 @@ class AuthRequest(BaseModel):
 # ============== 中间件 ==============
 
 # 允许的本地地址
-ALLOWED_HOSTS = {"127.0.0.1", "localhost", "::1", "testclient"}
+ALLOWED_HOSTS = frozenset({"127.0.0.1", "localhost", "::1", "testclient"})
+
+# 允许的局域网网段（元组形式，可直接传给str.startswith）
+ALLOWED_NETWORKS = ("10.", "192.168.", "172.16.", "172.17.", "172.18.", "172.19.", "172.20.", "172.21.", "172.22.", "172.23.", "172.24.", "172.25.", "172.26.", "172.27.", "172.28.", "172.29.", "172.30.", "172.31.")
 
-# 允许的局域网网段
-ALLOWED_NETWORKS = ["10.", "192.168.", "172.16.", "172.17.", "172.18.", "172.19.", "172.20.", "172.21.", "172.22.", "172.23.", "172.24.", "172.25.", "172.26.", "172.27.", "172.28.", "172.29.", "172.30.", "172.31."]
+# 无需访问控制的路径：静态文件、管理界面和文档
+PASSTHROUGH_PREFIXES = ("/static", "/management")
+PASSTHROUGH_EXACT = frozenset({"/docs", "/redoc", "/openapi.json", "/"})
 
 
 def is_allowed_host(host: str) -> bool:
@@ -122,16 +135,8 @@ def is_allowed_host(host: str) -> bool:
     if not host:
         return False
     
-    # 检查本地地址
-    if host in ALLOWED_HOSTS:
-        return True
-    
-    # 检查局域网地址
-    for network in ALLOWED_NETWORKS:
-        if host.startswith(network):
-            return True
-    
-    return False
+    # 检查本地地址和局域网地址
+    return host in ALLOWED_HOSTS or host.startswith(ALLOWED_NETWORKS)
 
 
 async def localhost_access_control(request: Request, call_next):
@@ -142,28 +147,20 @@ async def localhost_access_control(request: Request, call_next):
     
     Requirements: 9.1
     """
-    # 获取客户端IP
-    client_host = request.client.host if request.client else None
-    
-    # WebSocket连接的处理
-    if request.url.path == "/ws":
-        # WebSocket连接也需要验证来源
-        if not is_allowed_host(client_host):
-            logger.warning(f"WebSocket连接被拒绝: 非允许来源 {client_host}")
-            return JSONResponse(
-                status_code=403,
-                content={"detail": "Forbidden: Only local/LAN access is allowed"}
-            )
-        return await call_next(request)
+    path = request.url.path
     
     # 静态文件和文档路径放行
-    if request.url.path.startswith("/static") or request.url.path.startswith("/management") or request.url.path in ["/docs", "/redoc", "/openapi.json", "/"]:
+    if path.startswith(PASSTHROUGH_PREFIXES) or path in PASSTHROUGH_EXACT:
         return await call_next(request)
     
-    # API路径检查
-    if request.url.path.startswith("/api"):
+    # WebSocket连接和API路径需要验证来源
+    if path == "/ws" or path.startswith("/api"):
+        client_host = request.client.host if request.client else None
         if not is_allowed_host(client_host):
-            logger.warning(f"API请求被拒绝: 非允许来源 {client_host}")
+            if path == "/ws":
+                logger.warning(f"WebSocket连接被拒绝: 非允许来源 {client_host}")
+            else:
+                logger.warning(f"API请求被拒绝: 非允许来源 {client_host}")
             return JSONResponse(
                 status_code=403,
                 content={"detail": "Forbidden: Only local/LAN access is allowed"}
@@ -202,49 +199,185 @@ def get_ws_manager() -> WebSocketManager:
     return get_websocket_manager()
 
 
+class ResolvedToken:
+    """
+    已校验的活跃Token
+    
+    包含Token记录和账号类型，解密后的Token值在首次访问时计算
+    """
+    
+    __slots__ = ("token", "account_type", "_decrypted")
+    
+    def __init__(self, token):
+        self.token = token
+        self.account_type = enum_value(token.account_type)
+        self._decrypted: Optional[str] = None
+    
+    @property
+    def decrypted(self) -> str:
+        """解密后的Token值"""
+        if self._decrypted is None:
+            self._decrypted = decrypt_token(self.token.token_value)
+        return self._decrypted
+
+
+async def resolve_active_token(
+    token_id: int,
+    service: TokenService = Depends(get_service)
+) -> ResolvedToken:
+    """
+    获取并校验活跃Token
+    
+    Args:
+        token_id: Token ID
+        service: Token服务
+        
+    Returns:
+        ResolvedToken: 已校验的Token
+        
+    Raises:
+        HTTPException: Token不存在(404)、已过期或无效(400)、查询失败(500)
+    """
+    try:
+        token = service.get_by_id(token_id)
+    except TokenServiceError as e:
+        logger.error(f"获取Token失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if token is None:
+        raise HTTPException(status_code=404, detail=f"Token不存在: id={token_id}")
+    
+    if token.status != TokenStatus.ACTIVE:
+        raise HTTPException(status_code=400, detail="Token已过期或无效")
+    
+    return ResolvedToken(token)
+
+
 # ============== 辅助函数 ==============
 
-def token_to_response(token) -> TokenResponse:
-    """将Token模型转换为响应模型"""
+def enum_value(value, default: Optional[str] = AccountType.AGENT.value) -> Optional[str]:
+    """
+    取枚举字段的字符串值
+    
+    Args:
+        value: 枚举实例、字符串或None
+        default: value为空时的返回值，默认代理区账号类型
+        
+    Returns:
+        枚举的value；非枚举值原样返回；空值返回default
+    """
+    return value.value if isinstance(value, Enum) else (value or default)
+
+
+def token_to_dict(token) -> dict:
+    """
+    将Token模型转换为响应字典
+    
+    字段与TokenResponse一致，单个和列表转换共用此映射
+    
+    Args:
+        token: Token模型
+        
+    Returns:
+        dict: 响应字典
+    """
     # 尝试解密Token，如果失败则显示错误提示
     try:
         token_masked = mask_token(decrypt_token(token.token_value))
-    except (ValueError, Exception) as e:
+    except Exception as e:
         logger.warning(f"Token解密失败: id={token.id}, error={str(e)}")
         token_masked = "[解密失败-密钥不匹配]"
     
-    # 获取账号类型
-    account_type_value = "agent"
-    if token.account_type:
-        account_type_value = token.account_type.value if hasattr(token.account_type, 'value') else str(token.account_type)
-    
-    return TokenResponse(
-        id=token.id,
-        user_id=token.user_id,
-        account=token.account,
-        account_type=account_type_value,
-        token_masked=token_masked,
-        status=token.status.value if isinstance(token.status, TokenStatus) else token.status,
-        extension_id=token.extension_id,
-        network_code=token.network_code,
-        network_name=token.network_name,
-        network_id=token.network_id,
-        created_at=token.created_at.isoformat() if token.created_at else None,
-        updated_at=token.updated_at.isoformat() if token.updated_at else None,
-        last_active_at=token.last_active_at.isoformat() if token.last_active_at else None
-    )
+    created_at = token.created_at
+    updated_at = token.updated_at
+    last_active_at = token.last_active_at
+    
+    return {
+        "id": token.id,
+        "user_id": token.user_id,
+        "account": token.account,
+        "account_type": enum_value(token.account_type),
+        "token_masked": token_masked,
+        "status": enum_value(token.status, default=None),
+        "extension_id": token.extension_id,
+        "network_code": token.network_code,
+        "network_name": token.network_name,
+        "network_id": token.network_id,
+        "created_at": created_at.isoformat() if created_at else None,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+        "last_active_at": last_active_at.isoformat() if last_active_at else None
+    }
+
+
+def token_to_response(token) -> TokenResponse:
+    """将Token模型转换为响应模型"""
+    return TokenResponse(**token_to_dict(token))
+
+
+def tokens_to_responses(tokens) -> List[dict]:
+    """
+    批量将Token模型转换为响应字典
+    
+    跳过逐行的Pydantic模型构建，供列表接口直接序列化。
+    
+    Args:
+        tokens: Token模型列表
+        
+    Returns:
+        List[dict]: 响应字典列表
+    """
+    return [token_to_dict(token) for token in tokens]
+
+
+def compute_etag(parts: Iterable[str]) -> str:
+    """
+    根据资源版本信息计算ETag
+    
+    Args:
+        parts: 能标识资源当前版本的字符串序列
+        
+    Returns:
+        str: 带引号的ETag值
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\x00")
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """检查请求的If-None-Match是否与当前ETag一致"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    """构建304响应"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 # ============== REST API端点 ==============
 
-@app.get("/api/tokens", response_model=TokenListResponse, tags=["Tokens"])
+@app.get(
+    "/api/tokens",
+    response_model=None,
+    responses={200: {"model": TokenListResponse}},
+    tags=["Tokens"]
+)
 async def get_all_tokens(
+    request: Request,
     include_expired: bool = True,
     service: TokenService = Depends(get_service)
 ):
     """
     获取所有Token
     
+    支持ETag条件请求，列表未变化时返回304
+    
     Requirements: 4.1
     
     Args:
@@ -255,8 +388,19 @@ async def get_all_tokens(
     """
     try:
         tokens = service.get_all(include_expired=include_expired)
-        token_responses = [token_to_response(t) for t in tokens]
-        return TokenListResponse(total=len(token_responses), tokens=token_responses)
+        
+        etag = compute_etag(
+            f"{t.id}:{t.updated_at.isoformat() if t.updated_at else ''}"
+            for t in tokens
+        )
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        
+        rows = tokens_to_responses(tokens)
+        return ORJSONResponse(
+            content={"total": len(rows), "tokens": rows},
+            headers={"ETag": etag, "Cache-Control": "no-cache"}
+        )
     except TokenServiceError as e:
         logger.error(f"获取Token列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -400,39 +544,29 @@ async def websocket_endpoint(
         
         # 接收注册消息
         raw_data = await websocket.receive_text()
-        message = parse_message(raw_data)
-        validate_message(message)
+        message = decode_message(raw_data)
         
         if message["type"] != MessageType.REGISTER.value:
             # 第一条消息必须是注册消息
-            await websocket.send_json(create_error_message(
+            await websocket.send_text(serialize_message(create_error_message(
                 code=400,
                 message="第一条消息必须是注册消息"
-            ))
+            )))
             await websocket.close(code=1008, reason="未注册")
             return
         
-        # 验证注册消息
-        validate_register_payload(message["payload"])
         extension_id = message["payload"]["extensionId"]
         
-        # 关闭之前的accept，重新通过manager连接
-        # 注意：这里websocket已经accept了，所以直接存储连接信息
-        ws_manager._connections[extension_id] = type('ConnectionInfo', (), {
-            'websocket': websocket,
-            'extension_id': extension_id,
-            'user_id': None,
-            'connected_at': get_china_now(),
-            'last_heartbeat': get_china_now()
-        })()
+        # websocket已经accept，直接登记连接信息
+        ws_manager.register_accepted(websocket, extension_id)
         
         logger.info(f"插件注册成功: extension_id={extension_id}")
         
         # 发送注册确认
-        await websocket.send_json(create_register_ack_message(
+        await websocket.send_text(serialize_message(create_register_ack_message(
             success=True,
             message="注册成功"
-        ))
+        )))
         
         # 消息处理循环
         while True:
@@ -450,13 +584,13 @@ async def websocket_endpoint(
     except MessageParseError as e:
         logger.warning(f"消息解析失败: {str(e)}")
         try:
-            await websocket.send_json(create_error_message(code=400, message=str(e)))
+            await websocket.send_text(serialize_message(create_error_message(code=400, message=str(e))))
         except:
             pass
     except MessageValidationError as e:
         logger.warning(f"消息验证失败: {str(e)}")
         try:
-            await websocket.send_json(create_error_message(code=400, message=str(e)))
+            await websocket.send_text(serialize_message(create_error_message(code=400, message=str(e))))
         except:
             pass
     except Exception as e:
@@ -467,6 +601,78 @@ async def websocket_endpoint(
             await ws_manager.disconnect(extension_id)
 
 
+async def handle_token_upload(
+    websocket: WebSocket,
+    extension_id: str,
+    payload: TokenUploadPayload,
+    ws_manager: WebSocketManager,
+    service: TokenService
+):
+    """处理Token上报消息（payload已由decode_message验证）"""
+    token_value = payload["token"]
+    user_id = payload["userId"]
+    account = payload.get("account")  # 获取账号信息
+    account_type = payload.get("accountType")  # 获取账号类型
+    # 获取网点信息（仅网点账号有）
+    network_code = payload.get("networkCode")
+    network_name = payload.get("networkName")
+    network_id = payload.get("networkId")
+    
+    try:
+        token = service.create_or_update(
+            token=token_value,
+            user_id=user_id,
+            extension_id=extension_id,
+            account=account,
+            account_type=account_type,
+            network_code=network_code,
+            network_name=network_name,
+            network_id=network_id
+        )
+        
+        # 关联用户ID到连接
+        ws_manager.set_user_id(extension_id, user_id)
+        
+        await websocket.send_text(serialize_message(create_token_ack_message(
+            success=True,
+            token_id=token.id,
+            message="Token已保存"
+        )))
+        logger.info(f"Token上报成功: user_id={user_id}, account={account}, type={account_type}, network={network_code}, extension_id={extension_id}")
+        
+    except TokenValidationError as e:
+        await websocket.send_text(serialize_message(create_token_ack_message(
+            success=False,
+            message=str(e)
+        )))
+    except TokenServiceError as e:
+        await websocket.send_text(serialize_message(create_token_ack_message(
+            success=False,
+            message=f"存储失败: {str(e)}"
+        )))
+
+
+async def handle_heartbeat(
+    websocket: WebSocket,
+    extension_id: str,
+    payload: HeartbeatPayload,
+    ws_manager: WebSocketManager,
+    service: TokenService
+):
+    """处理心跳消息"""
+    ws_manager.update_heartbeat(extension_id)
+    await websocket.send_text(serialize_heartbeat_ack_message())
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"心跳响应: extension_id={extension_id}")
+
+
+# 消息类型 -> 处理函数
+MESSAGE_HANDLERS = {
+    MessageType.TOKEN_UPLOAD.value: handle_token_upload,
+    MessageType.HEARTBEAT.value: handle_heartbeat,
+}
+
+
 async def handle_websocket_message(
     websocket: WebSocket,
     extension_id: str,
@@ -485,80 +691,34 @@ async def handle_websocket_message(
         service: Token服务
     """
     try:
-        message = parse_message(raw_data)
-        validate_message(message)
+        message = decode_message(raw_data)
         
         msg_type = message["type"]
-        payload = message["payload"]
+        handler = MESSAGE_HANDLERS.get(msg_type)
         
-        if msg_type == MessageType.TOKEN_UPLOAD.value:
-            # 处理Token上报
-            validate_token_upload_payload(payload)
-            
-            token_value = payload["token"]
-            user_id = payload["userId"]
-            account = payload.get("account")  # 获取账号信息
-            account_type = payload.get("accountType")  # 获取账号类型
-            # 获取网点信息（仅网点账号有）
-            network_code = payload.get("networkCode")
-            network_name = payload.get("networkName")
-            network_id = payload.get("networkId")
-            
-            try:
-                token = service.create_or_update(
-                    token=token_value,
-                    user_id=user_id,
-                    extension_id=extension_id,
-                    account=account,
-                    account_type=account_type,
-                    network_code=network_code,
-                    network_name=network_name,
-                    network_id=network_id
-                )
-                
-                # 关联用户ID到连接
-                ws_manager.set_user_id(extension_id, user_id)
-                
-                await websocket.send_json(create_token_ack_message(
-                    success=True,
-                    token_id=token.id,
-                    message="Token已保存"
-                ))
-                logger.info(f"Token上报成功: user_id={user_id}, account={account}, type={account_type}, network={network_code}, extension_id={extension_id}")
-                
-            except TokenValidationError as e:
-                await websocket.send_json(create_token_ack_message(
-                    success=False,
-                    message=str(e)
-                ))
-            except TokenServiceError as e:
-                await websocket.send_json(create_token_ack_message(
-                    success=False,
-                    message=f"存储失败: {str(e)}"
-                ))
-        
-        elif msg_type == MessageType.HEARTBEAT.value:
-            # 处理心跳
-            ws_manager.update_heartbeat(extension_id)
-            await websocket.send_json(create_heartbeat_ack_message())
-            logger.debug(f"心跳响应: extension_id={extension_id}")
-        
-        else:
+        if handler is None:
             # 未知消息类型
             logger.warning(f"未处理的消息类型: {msg_type}")
-            await websocket.send_json(create_error_message(
+            await websocket.send_text(serialize_message(create_error_message(
                 code=400,
                 message=f"不支持的消息类型: {msg_type}"
-            ))
+            )))
+            return
+        
+        await handler(websocket, extension_id, message["payload"], ws_manager, service)
     
     except MessageParseError as e:
-        await websocket.send_json(create_error_message(code=400, message=str(e)))
+        await websocket.send_text(serialize_message(create_error_message(code=400, message=str(e))))
     except MessageValidationError as e:
-        await websocket.send_json(create_error_message(code=400, message=str(e)))
+        await websocket.send_text(serialize_message(create_error_message(code=400, message=str(e))))
 
 
 # ============== 认证端点 ==============
 
+# 管理密码摘要（启动时计算一次，比较时使用常量时间算法）
+_MANAGEMENT_PASSWORD_DIGEST = hashlib.sha256(MANAGEMENT_PASSWORD.encode()).digest()
+
+
 @app.post("/api/auth/verify", response_model=MessageResponse, tags=["Auth"])
 async def verify_password(data: AuthRequest):
     """
@@ -572,7 +732,8 @@ async def verify_password(data: AuthRequest):
     Returns:
         MessageResponse: 验证结果
     """
-    if data.password == MANAGEMENT_PASSWORD:
+    provided_digest = hashlib.sha256(data.password.encode()).digest()
+    if hmac.compare_digest(provided_digest, _MANAGEMENT_PASSWORD_DIGEST):
         logger.info("管理界面认证成功")
         return MessageResponse(success=True, message="认证成功")
     else:
@@ -582,16 +743,23 @@ async def verify_password(data: AuthRequest):
 
 # ============== 管理界面路由 ==============
 
+# 静态文件目录和管理界面页面（导入时计算一次）
+STATIC_DIR = Path(__file__).parent / "static"
+MANAGEMENT_HTML = str(STATIC_DIR / "management.html")
+# 管理界面页面允许浏览器缓存5分钟
+MANAGEMENT_HTML_HEADERS = {"Cache-Control": "public, max-age=300"}
+
+
 @app.get("/", tags=["Management"])
 async def redirect_to_management():
     """重定向到管理界面"""
-    return FileResponse(Path(__file__).parent / "static" / "management.html")
+    return FileResponse(MANAGEMENT_HTML, headers=MANAGEMENT_HTML_HEADERS)
 
 
 @app.get("/management", tags=["Management"])
 async def management_page():
     """管理界面入口"""
-    return FileResponse(Path(__file__).parent / "static" / "management.html")
+    return FileResponse(MANAGEMENT_HTML, headers=MANAGEMENT_HTML_HEADERS)
 
 
 # ============== 健康检查端点 ==============
@@ -621,11 +789,38 @@ class WaybillDownloadFileRequest(BaseModel):
     file_url: str = Field(..., description="文件URL路径")
 
 
+def export_false_sign_excel(authtoken: str, account_type: str, date: str, output_path: str) -> str:
+    """
+    生成虚假签收报表Excel（在工作线程中执行）
+    
+    Args:
+        authtoken: 解密后的Token值
+        account_type: 账号类型
+        date: 报表日期，格式：YYYY-MM-DD
+        output_path: 输出文件路径
+        
+    Returns:
+        str: 生成的文件路径，无数据时为空字符串
+    """
+    from modules.false_sign import FalseSignModule
+    
+    module = FalseSignModule(authtoken=authtoken, account_type=account_type)
+    return module.export_excel(date=date, output_path=output_path)
+
+
+def remove_file_quietly(path: str) -> None:
+    """删除文件，文件不存在时忽略"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
 @app.post("/api/false-sign-report/{token_id}", tags=["Reports"])
 async def download_false_sign_report(
     token_id: int,
     data: FalseSignReportRequest = None,
-    service: TokenService = Depends(get_service)
+    resolved: ResolvedToken = Depends(resolve_active_token)
 ):
     """
     下载虚假签收报表
@@ -641,7 +836,6 @@ async def download_false_sign_report(
         FileResponse: Excel文件
     """
     import sys
-    import os
     from datetime import timedelta
     
     # 添加项目根目录到路径
@@ -650,21 +844,8 @@ async def download_false_sign_report(
         sys.path.insert(0, str(project_root))
     
     try:
-        # 获取Token
-        token = service.get_by_id(token_id)
-        if token is None:
-            raise HTTPException(status_code=404, detail=f"Token不存在: id={token_id}")
-        
-        if token.status.value != 'active':
-            raise HTTPException(status_code=400, detail="Token已过期或无效")
-        
-        # 解密Token
-        decrypted_token = decrypt_token(token.token_value)
-        
-        # 获取账号类型
-        account_type = "agent"
-        if token.account_type:
-            account_type = token.account_type.value if hasattr(token.account_type, 'value') else str(token.account_type)
+        decrypted_token = resolved.decrypted
+        account_type = resolved.account_type
         
         # 确定日期
         target_date = None
@@ -673,13 +854,25 @@ async def download_false_sign_report(
         else:
             target_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         
-        # 调用虚假签收模块，传入账号类型
-        from modules.false_sign import FalseSignModule
+        # 每个请求写入独立的临时文件，同日期的并发导出不会互相覆盖或删除
+        fd, output_path = tempfile.mkstemp(prefix="false_sign_", suffix=".xlsx")
+        os.close(fd)
         
-        module = FalseSignModule(authtoken=decrypted_token, account_type=account_type)
-        output_path = module.export_excel(date=target_date)
+        # 报表生成以阻塞的HTTP请求为主，放到线程中执行避免阻塞事件循环
+        try:
+            exported = await asyncio.to_thread(
+                export_false_sign_excel,
+                decrypted_token,
+                account_type,
+                target_date,
+                output_path
+            )
+        except BaseException:
+            remove_file_quietly(output_path)
+            raise
         
-        if not output_path or not os.path.exists(output_path):
+        if not exported:
+            remove_file_quietly(output_path)
             return JSONResponse(
                 status_code=200,
                 content={
@@ -690,12 +883,14 @@ async def download_false_sign_report(
                 }
             )
         
-        # 返回文件
-        filename = os.path.basename(output_path)
+        # 返回文件，发送完成后删除本次请求的临时文件
+        type_suffix = "代理区" if account_type == AccountType.AGENT.value else "网点"
+        filename = f"虚假签收报表_{type_suffix}_{target_date}.xlsx"
         return FileResponse(
             path=output_path,
             filename=filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            background=BackgroundTask(remove_file_quietly, output_path)
         )
         
     except HTTPException:
@@ -705,11 +900,33 @@ async def download_false_sign_report(
         raise HTTPException(status_code=500, detail=f"下载失败: {str(e)}")
 
 
-@app.get("/api/connections", tags=["WebSocket"])
-async def get_connections(ws_manager: WebSocketManager = Depends(get_ws_manager)):
+# 管理界面WebSocket连接的extension_id前缀
+MANAGEMENT_UI_PREFIX = "management-ui-"
+
+_connection_fields = attrgetter("extension_id", "user_id", "connected_at_iso", "last_heartbeat_iso")
+
+
+def connection_to_dict(conn) -> dict:
+    """将连接信息转换为响应字典"""
+    extension_id, user_id, connected_at, last_heartbeat = _connection_fields(conn)
+    return {
+        "extension_id": extension_id,
+        "user_id": user_id,
+        "connected_at": connected_at,
+        "last_heartbeat": last_heartbeat
+    }
+
+
+@app.get("/api/connections", response_model=None, tags=["WebSocket"])
+async def get_connections(
+    request: Request,
+    ws_manager: WebSocketManager = Depends(get_ws_manager)
+):
     """
     获取当前WebSocket连接列表
     
+    支持ETag条件请求，连接列表未变化时返回304
+    
     Returns:
         连接信息列表（不包含管理界面连接）
     """
@@ -717,20 +934,24 @@ async def get_connections(ws_manager: WebSocketManager = Depends(get_ws_manager)
     # 过滤掉管理界面的连接（以management-ui-开头的）
     plugin_connections = [
         conn for conn in connections 
-        if not conn.extension_id.startswith('management-ui-')
+        if not conn.extension_id.startswith(MANAGEMENT_UI_PREFIX)
     ]
-    return {
-        "total": len(plugin_connections),
-        "connections": [
-            {
-                "extension_id": conn.extension_id,
-                "user_id": conn.user_id,
-                "connected_at": conn.connected_at.isoformat() if conn.connected_at else None,
-                "last_heartbeat": conn.last_heartbeat.isoformat() if conn.last_heartbeat else None
-            }
-            for conn in plugin_connections
-        ]
-    }
+    
+    etag = compute_etag(
+        f"{conn.extension_id}:{conn.user_id}:{conn.connected_at_iso or ''}:"
+        f"{conn.last_heartbeat!r}"
+        for conn in plugin_connections
+    )
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    
+    return ORJSONResponse(
+        content={
+            "total": len(plugin_connections),
+            "connections": [connection_to_dict(conn) for conn in plugin_connections]
+        },
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 
 # ============== 寄件运单下载API ==============
@@ -743,7 +964,7 @@ waybill_download_tasks = {}  # task_id -> task_info
 async def submit_waybill_download_task(
     token_id: int,
     data: WaybillDownloadSubmitRequest,
-    service: TokenService = Depends(get_service)
+    resolved: ResolvedToken = Depends(resolve_active_token)
 ):
     """
     提交寄件运单下载任务到下载中心
@@ -761,16 +982,8 @@ async def submit_waybill_download_task(
     import uuid
     
     try:
-        # 获取Token
-        token = service.get_by_id(token_id)
-        if token is None:
-            raise HTTPException(status_code=404, detail=f"Token不存在: id={token_id}")
-        
-        if token.status.value != 'active':
-            raise HTTPException(status_code=400, detail="Token已过期或无效")
-        
-        # 解密Token
-        decrypted_token = decrypt_token(token.token_value)
+        token = resolved.token
+        decrypted_token = resolved.decrypted
         
         # pickFinanceCode应该是代理区编码（如350000），从user_id中提取前6位数字
         user_id_digits = ''.join(filter(str.isdigit, token.user_id))
@@ -1121,15 +1334,9 @@ async def retry_waybill_download_task(
         raise HTTPException(status_code=404, detail="任务不存在")
     
     # 获取Token
-    token = service.get_by_id(task_info["token_id"])
-    if token is None:
-        raise HTTPException(status_code=404, detail="Token不存在")
-    
-    if token.status.value != 'active':
-        raise HTTPException(status_code=400, detail="Token已过期或无效")
-    
-    # 解密Token
-    decrypted_token = decrypt_token(token.token_value)
+    resolved = await resolve_active_token(task_info["token_id"], service)
+    token = resolved.token
+    decrypted_token = resolved.decrypted
     
     # pickFinanceCode
     user_id_digits = ''.join(filter(str.isdigit, token.user_id))
@@ -1543,6 +1750,65 @@ async def download_extension():
 # 问题件图片路径（相对于项目根目录）
 PROBLEM_PIECE_IMAGE_PATH = Path(__file__).parent.parent / "wentijian.png"
 
+# 问题件列表缓存有效期（秒）
+PROBLEM_PIECE_LIST_CACHE_TTL = 20
+# 问题件列表缓存的最大条目数，超出时淘汰最久未使用的条目
+PROBLEM_PIECE_LIST_CACHE_MAXSIZE = 256
+
+# 问题件列表缓存（LRU顺序）：(token_id, date) -> (缓存时间, 响应数据)
+_problem_piece_list_cache: "OrderedDict[Tuple[int, str], Tuple[float, dict]]" = OrderedDict()
+# 每个缓存键一把锁及其使用者数量，合并并发刷新；最后一个使用者退出时移除
+_problem_piece_list_locks: Dict[Tuple[int, str], list] = {}
+
+
+def _get_cached_problem_piece_list(key: Tuple[int, str]) -> Optional[dict]:
+    """获取未过期的问题件列表缓存，过期条目在读取时删除"""
+    entry = _problem_piece_list_cache.get(key)
+    if entry is None:
+        return None
+    cached_at, payload = entry
+    if time.monotonic() - cached_at >= PROBLEM_PIECE_LIST_CACHE_TTL:
+        del _problem_piece_list_cache[key]
+        return None
+    _problem_piece_list_cache.move_to_end(key)
+    return payload
+
+
+def _set_cached_problem_piece_list(key: Tuple[int, str], payload: dict) -> None:
+    """写入问题件列表缓存，超出容量时淘汰最久未使用的条目"""
+    _problem_piece_list_cache[key] = (time.monotonic(), payload)
+    _problem_piece_list_cache.move_to_end(key)
+    while len(_problem_piece_list_cache) > PROBLEM_PIECE_LIST_CACHE_MAXSIZE:
+        _problem_piece_list_cache.popitem(last=False)
+
+
+@asynccontextmanager
+async def _problem_piece_list_lock(key: Tuple[int, str]):
+    """
+    获取缓存键对应的锁
+    
+    锁按使用者计数，只有在没有请求持有或等待时才从锁表中移除，
+    保证同一缓存键在任意时刻只有一把锁
+    """
+    entry = _problem_piece_list_locks.get(key)
+    if entry is None:
+        entry = _problem_piece_list_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _problem_piece_list_locks[key]
+
+
+def invalidate_problem_piece_list_cache(token_id: int) -> None:
+    """清除指定Token的全部问题件列表缓存"""
+    for key in [k for k in _problem_piece_list_cache if k[0] == token_id]:
+        del _problem_piece_list_cache[key]
+
+
 class ProblemPieceRequest(BaseModel):
     """问题件登记请求模型"""
     waybill_no: str = Field(..., min_length=1, description="运单号")
@@ -1668,17 +1934,267 @@ async def upload_problem_piece_image(token_value: str, client) -> Optional[str]:
         return None
 
 
+def build_problem_piece_request(waybill_no: str, network_id: int, paths: str) -> dict:
+    """
+    构建问题件登记请求数据（根据HAR文件分析）
+    
+    Args:
+        waybill_no: 运单号
+        network_id: 网点ID
+        paths: 已上传的问题件图片路径，未上传则为空字符串
+        
+    Returns:
+        登记请求数据
+    """
+    return {
+        "waybillNo": waybill_no,
+        "replyContent": "",
+        "problemPieceId": "",
+        "probleTypeSubjectId": 118,
+        "probleTypeSubjectId2": 100037,
+        "receiveNetworkId": network_id,
+        "replyContentImg": [],
+        "replyStatus": 0,
+        "probleTypeId": 4,
+        "probleDescription": "此件到达我司运单信息缺失，我司已安排补打运单并安排最近班次转出。",
+        "uploadDataProp": "success",
+        "knowNetwork": "",
+        "defaultKnow": None,
+        "firstLevelTypeName": "运单信息不全",
+        "changeDeliveryDate": "",
+        "deliveryTime": "",
+        "firstLevelTypeCode": "26",
+        "isChangePackaging": "",
+        "materialCode": "",
+        "thirdExpressId": "",
+        "thirdExpressCode": "",
+        "thirdExpressName": "",
+        "thirdWaybillNo": "",
+        "provinceName": "",
+        "cityName": "",
+        "districtName": "",
+        "provinceId": "",
+        "cityId": "",
+        "districtId": "",
+        "address": "",
+        "receiveName": "",
+        "receivePhone": "",
+        "problemTypeSubjectCode": "26",
+        "secondLevelTypeId": 100037,
+        "secondLevelTypeCode": "26a",
+        "secondLevelTypeName": "运单信息不全a",
+        "changeDeliveryTime": "",
+        "paths": paths,
+        "isCallConnectResult": False,
+        "countryId": "1"
+    }
+
+
+async def post_problem_piece_registration(
+    client,
+    token_value: str,
+    network_id: int,
+    waybill_no: str,
+    image_path: Optional[str]
+) -> dict:
+    """
+    提交单个运单的问题件登记
+    
+    Args:
+        client: httpx.AsyncClient实例
+        token_value: 解密后的Token值
+        network_id: 网点ID
+        waybill_no: 运单号
+        image_path: 已上传的问题件图片路径
+        
+    Returns:
+        登记结果
+    """
+    headers = {
+        "authToken": token_value,
+        "Content-Type": "application/json;charset=UTF-8",
+        "lang": "zh_CN",
+        "routeName": "batchProblem"
+    }
+    
+    response = await client.post(
+        "https://wdgw.jtexpress.com.cn/servicequality/problemPiece/registration",
+        json=build_problem_piece_request(waybill_no, network_id, image_path or ""),
+        headers=headers
+    )
+    result = response.json()
+    
+    if result.get("code") == 1 and result.get("succ"):
+        logger.info(f"问题件登记成功: waybill_no={waybill_no}, network_id={network_id}, image={image_path}")
+        return {
+            "success": True,
+            "message": "问题件登记成功",
+            "waybill_no": waybill_no,
+            "image_uploaded": bool(image_path)
+        }
+    
+    error_msg = result.get("msg", "登记失败")
+    logger.warning(f"问题件登记失败: waybill_no={waybill_no}, error={error_msg}")
+    return {
+        "success": False,
+        "message": error_msg,
+        "waybill_no": waybill_no
+    }
+
+
+class _PendingProblemPieceBatch:
+    """同一Token待提交的问题件登记批次"""
+    
+    __slots__ = ("token_value", "network_id", "items", "timer")
+    
+    def __init__(self, token_value: str, network_id: int):
+        self.token_value = token_value
+        self.network_id = network_id
+        self.items: List[tuple] = []  # (waybill_no, future)
+        self.timer: Optional[asyncio.Task] = None
+
+
+class ProblemPieceBatcher:
+    """
+    问题件登记合并器
+    
+    将短时间窗口内同一Token的登记请求合并为一批：整批共享一个HTTP客户端
+    和一次图片上传，再以有限并发提交各运单，结果分发回各调用方。
+    
+    该Token没有在途批次时，批次在本轮事件循环结束后立即提交，同一轮内到达的
+    请求仍会并入，单个请求不增加等待；已有在途批次时，后续请求在达到max_batch条
+    或距第一条请求max_wait_ms毫秒后提交。
+    """
+    
+    def __init__(self, max_batch: int = 32, max_wait_ms: int = 50, concurrency: int = 8):
+        """
+        初始化合并器
+        
+        Args:
+            max_batch: 单批最大运单数
+            max_wait_ms: 批次最长等待时间（毫秒）
+            concurrency: 单批内并发提交的最大请求数
+        """
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._concurrency = concurrency
+        self._pending: dict = {}  # token_id -> _PendingProblemPieceBatch
+        self._inflight: Dict[int, int] = {}  # token_id -> 在途批次数
+        # 持有后台任务的引用，事件循环只弱引用任务，未被引用的任务可能被回收
+        self._tasks: set = set()
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """创建后台任务并保留引用直到任务结束"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    async def submit(self, token_id: int, token_value: str, network_id: int, waybill_no: str) -> dict:
+        """
+        提交一个运单的登记请求并等待其结果
+        
+        Args:
+            token_id: Token ID
+            token_value: 解密后的Token值
+            network_id: 网点ID
+            waybill_no: 运单号
+            
+        Returns:
+            该运单的登记结果
+        """
+        future = asyncio.get_running_loop().create_future()
+        
+        batch = self._pending.get(token_id)
+        if batch is None:
+            batch = _PendingProblemPieceBatch(token_value, network_id)
+            # 已有在途批次时才等待合并窗口，否则立即提交
+            delay = self._max_wait if token_id in self._inflight else 0
+            batch.timer = self._spawn(self._flush_later(token_id, batch, delay))
+            self._pending[token_id] = batch
+        batch.items.append((waybill_no, future))
+        
+        if len(batch.items) >= self._max_batch:
+            batch.timer.cancel()
+            self._take(token_id, batch)
+            self._spawn(self._dispatch(token_id, batch))
+        
+        return await future
+    
+    def _take(self, token_id: int, batch: _PendingProblemPieceBatch) -> None:
+        """将批次移出待合并表，并记为该Token的在途批次"""
+        if self._pending.get(token_id) is batch:
+            del self._pending[token_id]
+        self._inflight[token_id] = self._inflight.get(token_id, 0) + 1
+    
+    async def _flush_later(self, token_id: int, batch: _PendingProblemPieceBatch, delay: float) -> None:
+        """等待合并窗口结束后提交批次"""
+        if delay:
+            await asyncio.sleep(delay)
+        self._take(token_id, batch)
+        await self._dispatch(token_id, batch)
+    
+    async def _dispatch(self, token_id: int, batch: _PendingProblemPieceBatch) -> None:
+        """提交已移出待合并表的批次，结束后清除在途标记"""
+        try:
+            await self._run_batch(batch)
+        finally:
+            remaining = self._inflight[token_id] - 1
+            if remaining:
+                self._inflight[token_id] = remaining
+            else:
+                del self._inflight[token_id]
+    
+    async def _run_batch(self, batch: _PendingProblemPieceBatch) -> None:
+        """提交一批登记请求，并把结果分发给各调用方"""
+        import httpx
+        
+        semaphore = asyncio.Semaphore(self._concurrency)
+        
+        async def register_one(client, image_path, waybill_no, future):
+            async with semaphore:
+                try:
+                    result = await post_problem_piece_registration(
+                        client, batch.token_value, batch.network_id, waybill_no, image_path
+                    )
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+            if not future.done():
+                future.set_result(result)
+        
+        try:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                # 整批共享同一张问题件图片
+                image_path = await upload_problem_piece_image(batch.token_value, client)
+                await asyncio.gather(*[
+                    register_one(client, image_path, waybill_no, future)
+                    for waybill_no, future in batch.items
+                ])
+            logger.info(f"问题件批量登记完成: count={len(batch.items)}, network_id={batch.network_id}")
+        except Exception as e:
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+
+
+# 全局问题件登记合并器
+problem_piece_batcher = ProblemPieceBatcher()
+
+
 @app.post("/api/problem-piece/{token_id}", tags=["ProblemPiece"])
 async def register_problem_piece(
     token_id: int,
     data: ProblemPieceRequest,
+    resolved: ResolvedToken = Depends(resolve_active_token),
     service: TokenService = Depends(get_service)
 ):
     """
     问题件登记
     
     使用指定Token的凭证进行问题件登记（仅网点账号可用）
-    会自动上传预设的问题件图片
+    会自动上传预设的问题件图片，同一Token的并发请求会被合并提交
     
     Args:
         token_id: Token ID
@@ -1687,27 +2203,13 @@ async def register_problem_piece(
     Returns:
         登记结果
     """
-    import httpx
-    
     try:
-        # 获取Token
-        token = service.get_by_id(token_id)
-        if token is None:
-            raise HTTPException(status_code=404, detail=f"Token不存在: id={token_id}")
-        
-        if token.status.value != 'active':
-            raise HTTPException(status_code=400, detail="Token已过期或无效")
-        
         # 检查账号类型
-        account_type = "agent"
-        if token.account_type:
-            account_type = token.account_type.value if hasattr(token.account_type, 'value') else str(token.account_type)
-        
-        if account_type != 'network':
+        if resolved.account_type != 'network':
             raise HTTPException(status_code=400, detail="问题件登记仅支持网点账号")
         
-        # 解密Token
-        decrypted_token = decrypt_token(token.token_value)
+        token = resolved.token
+        decrypted_token = resolved.decrypted
         
         # 获取网点ID
         network_id = token.network_id
@@ -1721,103 +2223,138 @@ async def register_problem_piece(
         if not network_id:
             raise HTTPException(status_code=400, detail="无法获取网点ID，请重新登录")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # 上传图片
-            image_path = await upload_problem_piece_image(decrypted_token, client)
-            paths_value = image_path if image_path else ""
-            
-            # 构建请求数据（根据HAR文件分析）
+        result = await problem_piece_batcher.submit(token_id, decrypted_token, network_id, data.waybill_no)
+        if result.get("success"):
+            # 登记状态已变化，列表缓存失效
+            invalidate_problem_piece_list_cache(token_id)
+        return result
+                
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"问题件登记异常: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"登记失败: {str(e)}")
+
+
+async def fetch_problem_piece_list(
+    token_value: str,
+    network_id: int,
+    network_name: Optional[str],
+    network_code: str,
+    target_date: str
+) -> dict:
+    """
+    从网点系统分页拉取问题件列表，并区分已登记/未登记运单
+    
+    Args:
+        token_value: 解密后的Token值
+        network_id: 网点ID
+        network_name: 网点名称
+        network_code: 网点编码
+        target_date: 查询日期，格式：YYYY-MM-DD
+        
+    Returns:
+        问题件列表响应数据
+    """
+    import httpx
+    
+    headers = {
+        "authToken": token_value,
+        "Content-Type": "application/json;charset=UTF-8",
+        "lang": "zh_CN",
+        "routeName": "OutofWarehouseParts"
+    }
+    
+    # 分页获取所有数据
+    all_records = []
+    current_page = 1
+    page_size = 100
+    
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        while True:
             request_data = {
-                "waybillNo": data.waybill_no,
-                "replyContent": "",
-                "problemPieceId": "",
-                "probleTypeSubjectId": 118,
-                "probleTypeSubjectId2": 100037,
-                "receiveNetworkId": network_id,
-                "replyContentImg": [],
-                "replyStatus": 0,
-                "probleTypeId": 4,
-                "probleDescription": "此件到达我司运单信息缺失，我司已安排补打运单并安排最近班次转出。",
-                "uploadDataProp": "success",
-                "knowNetwork": "",
-                "defaultKnow": None,
-                "firstLevelTypeName": "运单信息不全",
-                "changeDeliveryDate": "",
-                "deliveryTime": "",
-                "firstLevelTypeCode": "26",
-                "isChangePackaging": "",
-                "materialCode": "",
-                "thirdExpressId": "",
-                "thirdExpressCode": "",
-                "thirdExpressName": "",
-                "thirdWaybillNo": "",
-                "provinceName": "",
-                "cityName": "",
-                "districtName": "",
-                "provinceId": "",
-                "cityId": "",
-                "districtId": "",
-                "address": "",
-                "receiveName": "",
-                "receivePhone": "",
-                "problemTypeSubjectCode": "26",
-                "secondLevelTypeId": 100037,
-                "secondLevelTypeCode": "26a",
-                "secondLevelTypeName": "运单信息不全a",
-                "changeDeliveryTime": "",
-                "paths": paths_value,
-                "isCallConnectResult": False,
+                "current": current_page,
+                "size": page_size,
+                "networkId": network_id,
+                "networkName": network_name or "",
+                "networkCode": network_code,
+                "inputDate": target_date,
+                "signType": 0,
+                "isCurrent": "1",
+                "deliverUser": None,
                 "countryId": "1"
             }
             
-            headers = {
-                "authToken": decrypted_token,
-                "Content-Type": "application/json;charset=UTF-8",
-                "lang": "zh_CN",
-                "routeName": "batchProblem"
-            }
-            
             response = await client.post(
-                "https://wdgw.jtexpress.com.cn/servicequality/problemPiece/registration",
+                "https://wdgw.jtexpress.com.cn/reportgateway/bigdataReport/detailDir/businessin/nms_deliver_area_monitor_detail_new",
                 json=request_data,
                 headers=headers
             )
             result = response.json()
             
-            if result.get("code") == 1 and result.get("succ"):
-                logger.info(f"问题件登记成功: waybill_no={data.waybill_no}, network_id={network_id}, image={image_path}")
-                return {
-                    "success": True,
-                    "message": "问题件登记成功",
-                    "waybill_no": data.waybill_no,
-                    "image_uploaded": bool(image_path)
-                }
-            else:
-                error_msg = result.get("msg", "登记失败")
-                logger.warning(f"问题件登记失败: waybill_no={data.waybill_no}, error={error_msg}")
-                return {
-                    "success": False,
-                    "message": error_msg,
-                    "waybill_no": data.waybill_no
-                }
-                
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"问题件登记异常: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"登记失败: {str(e)}")
+            if result.get("code") != 1 or not result.get("data"):
+                break
+            
+            records = result.get("data", {}).get("records", [])
+            if not records:
+                break
+            
+            all_records.extend(records)
+            
+            # 如果返回的记录数小于page_size，说明已经是最后一页
+            if len(records) < page_size:
+                break
+            
+            current_page += 1
+            
+            # 安全限制，最多获取10页
+            if current_page > 10:
+                break
+    
+    # 筛选未登记的运单（没有problemTime字段的）
+    unregistered = []
+    registered = []
+    
+    for record in all_records:
+        waybill_info = {
+            "billcode": record.get("billcode"),
+            "deliveruser": record.get("deliveruser"),
+            "deliverTime": record.get("deliverTime"),
+            "problemTime": record.get("problemTime"),
+            "problemTypeOne": record.get("problemTypeOne"),
+            "thirdCode": record.get("thirdCode")
+        }
+        
+        if record.get("problemTime"):
+            registered.append(waybill_info)
+        else:
+            unregistered.append(waybill_info)
+    
+    logger.info(f"获取问题件列表: date={target_date}, total={len(all_records)}, unregistered={len(unregistered)}, registered={len(registered)}")
+    
+    return {
+        "success": True,
+        "date": target_date,
+        "network_name": network_name,
+        "total": len(all_records),
+        "unregistered_count": len(unregistered),
+        "registered_count": len(registered),
+        "unregistered": unregistered,
+        "registered": registered
+    }
 
 
-@app.post("/api/problem-piece/{token_id}/list", tags=["ProblemPiece"])
+@app.post("/api/problem-piece/{token_id}/list", response_model=None, tags=["ProblemPiece"])
 async def get_problem_piece_list(
     token_id: int,
     data: ProblemPieceListRequest = None,
-    service: TokenService = Depends(get_service)
+    resolved: ResolvedToken = Depends(resolve_active_token)
 ):
     """
     获取问题件列表
     
-    获取指定日期的问题件列表，返回未登记的运单号
+    获取指定日期的问题件列表，返回未登记的运单号。
+    结果按(token_id, 日期)缓存PROBLEM_PIECE_LIST_CACHE_TTL秒，并发刷新只拉取一次上游。
     
     Args:
         token_id: Token ID
@@ -1826,27 +2363,12 @@ async def get_problem_piece_list(
     Returns:
         问题件列表
     """
-    import httpx
-    
     try:
-        # 获取Token
-        token = service.get_by_id(token_id)
-        if token is None:
-            raise HTTPException(status_code=404, detail=f"Token不存在: id={token_id}")
-        
-        if token.status.value != 'active':
-            raise HTTPException(status_code=400, detail="Token已过期或无效")
-        
         # 检查账号类型
-        account_type = "agent"
-        if token.account_type:
-            account_type = token.account_type.value if hasattr(token.account_type, 'value') else str(token.account_type)
-        
-        if account_type != 'network':
+        if resolved.account_type != 'network':
             raise HTTPException(status_code=400, detail="问题件列表仅支持网点账号")
         
-        # 解密Token
-        decrypted_token = decrypt_token(token.token_value)
+        token = resolved.token
         
         # 获取网点信息
         network_id = token.network_id
@@ -1863,90 +2385,24 @@ async def get_problem_piece_list(
         else:
             target_date = datetime.now().strftime("%Y-%m-%d")
         
-        headers = {
-            "authToken": decrypted_token,
-            "Content-Type": "application/json;charset=UTF-8",
-            "lang": "zh_CN",
-            "routeName": "OutofWarehouseParts"
-        }
-        
-        # 分页获取所有数据
-        all_records = []
-        current_page = 1
-        page_size = 100
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            while True:
-                request_data = {
-                    "current": current_page,
-                    "size": page_size,
-                    "networkId": network_id,
-                    "networkName": network_name or "",
-                    "networkCode": network_code,
-                    "inputDate": target_date,
-                    "signType": 0,
-                    "isCurrent": "1",
-                    "deliverUser": None,
-                    "countryId": "1"
-                }
-                
-                response = await client.post(
-                    "https://wdgw.jtexpress.com.cn/reportgateway/bigdataReport/detailDir/businessin/nms_deliver_area_monitor_detail_new",
-                    json=request_data,
-                    headers=headers
-                )
-                result = response.json()
-                
-                if result.get("code") != 1 or not result.get("data"):
-                    break
-                
-                records = result.get("data", {}).get("records", [])
-                if not records:
-                    break
-                
-                all_records.extend(records)
-                
-                # 如果返回的记录数小于page_size，说明已经是最后一页
-                if len(records) < page_size:
-                    break
-                
-                current_page += 1
-                
-                # 安全限制，最多获取10页
-                if current_page > 10:
-                    break
-        
-        # 筛选未登记的运单（没有problemTime字段的）
-        unregistered = []
-        registered = []
-        
-        for record in all_records:
-            waybill_info = {
-                "billcode": record.get("billcode"),
-                "deliveruser": record.get("deliveruser"),
-                "deliverTime": record.get("deliverTime"),
-                "problemTime": record.get("problemTime"),
-                "problemTypeOne": record.get("problemTypeOne"),
-                "thirdCode": record.get("thirdCode")
-            }
-            
-            if record.get("problemTime"):
-                registered.append(waybill_info)
-            else:
-                unregistered.append(waybill_info)
-        
-        logger.info(f"获取问题件列表: date={target_date}, total={len(all_records)}, unregistered={len(unregistered)}, registered={len(registered)}")
-        
-        return {
-            "success": True,
-            "date": target_date,
-            "network_name": network_name,
-            "total": len(all_records),
-            "unregistered_count": len(unregistered),
-            "registered_count": len(registered),
-            "unregistered": unregistered,
-            "registered": registered
-        }
+        cache_key = (token_id, target_date)
+        payload = _get_cached_problem_piece_list(cache_key)
+        if payload is None:
+            async with _problem_piece_list_lock(cache_key):
+                # 等锁期间可能已由其他请求拉取完成
+                payload = _get_cached_problem_piece_list(cache_key)
+                if payload is None:
+                    payload = await fetch_problem_piece_list(
+                        resolved.decrypted,
+                        network_id,
+                        network_name,
+                        network_code,
+                        target_date
+                    )
+                    _set_cached_problem_piece_list(cache_key, payload)
+        
+        # 记录均为上游返回的纯JSON数据，直接由orjson序列化
+        return ORJSONResponse(content=payload)
         
     except HTTPException:
         raise
@@ -1967,10 +2423,9 @@ async def startup_event():
     init_database()
     
     # 挂载静态文件目录
-    static_dir = Path(__file__).parent / "static"
-    if static_dir.exists():
-        app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
-        logger.info(f"静态文件目录已挂载: {static_dir}")
+    if STATIC_DIR.exists():
+        app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+        logger.info(f"静态文件目录已挂载: {STATIC_DIR}")
     
     # 启动WebSocket心跳检测
     ws_manager = get_websocket_manager()
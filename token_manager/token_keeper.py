@@ -13,13 +13,19 @@ Requirements: 5.1, 5.2, 5.3, 5.4, 5.5, 6.1
 
 import asyncio
 import logging
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Optional, List, Callable, Awaitable
+from typing import Optional, List, Dict, Tuple, Union, Callable, Awaitable
 
 import httpx
+from sqlalchemy import Row
 
 from .config import (
     KEEP_ALIVE_INTERVAL, 
+    KEEP_ALIVE_CONCURRENCY,
+    KEEP_ALIVE_MIN_INTERVAL,
+    KEEP_ALIVE_MAX_INTERVAL,
     KEEP_ALIVE_URL, 
     AGENT_KEEP_ALIVE_URL,
     AGENT_KEEP_ALIVE_HEADERS,
@@ -28,21 +34,71 @@ from .config import (
     NETWORK_KEEP_ALIVE_BODY,
     get_china_now
 )
-from .models import Token, TokenStatus, AccountType
+from .models import TokenStatus, AccountType
 from .token_service import TokenService, get_token_service
 from .crypto_utils import decrypt_token, mask_token
-from .websocket_manager import WebSocketManager, get_websocket_manager
-from .message_protocol import create_token_expired_message
+from .websocket_manager import WebSocketManager, ConnectionInfo, get_websocket_manager
+from .message_protocol import create_token_expired_message, serialize_token_expired_messages
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 有效性校验结果缓存的最大条目数
+VERIFY_CACHE_MAXSIZE = 4096
+
+# 停止服务时等待保活循环自行退出的时间（秒），超时则取消
+STOP_GRACE_SECONDS = 1.0
+
+# 建立连接失败时传输层的重试次数
+HTTP_CONNECT_RETRIES = 2
+
+# 解密结果缓存的最大条目数
+DECRYPT_CACHE_MAXSIZE = 4096
+
+# 连续多少轮无失效后放宽保活间隔
+ADAPTIVE_WINDOW = 3
+# 放宽保活间隔的倍数
+ADAPTIVE_BACKOFF = 1.5
+
+# 保活请求共用的浏览器请求头
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+
+def _decrypt_many(values: List[str]) -> List[Union[str, Exception]]:
+    """
+    批量解密Token，供线程池调用
+    
+    单个Token解密失败不影响其他Token，失败项以异常对象返回
+    
+    Args:
+        values: 加密后的Token值列表
+        
+    Returns:
+        List[Union[str, Exception]]: 与输入一一对应的解密结果
+    """
+    results: List[Union[str, Exception]] = []
+    for value in values:
+        try:
+            results.append(decrypt_token(value))
+        except Exception as e:
+            results.append(e)
+    return results
+
 
 class TokenKeeperError(Exception):
     """Token保活服务异常基类"""
     pass
 
 
+class TransientCheckError(TokenKeeperError):
+    """保活请求临时失败（超时、网络错误），无法判断Token是否有效"""
+    pass
+
+
 class TokenKeeper:
     """
     Token保活服务
@@ -50,8 +106,8 @@ class TokenKeeper:
     定时对所有活跃状态的Token执行保活操作，防止Token因长时间未使用而过期。
     
     Features:
-    - 可配置的保活间隔
-    - 异步HTTP请求
+    - 可配置的保活间隔，并按失效情况自适应调整
+    - 异步并发HTTP请求（并发数可配置）
     - 自动标记失效Token
     - WebSocket失效通知推送
     
@@ -67,7 +123,10 @@ class TokenKeeper:
         interval_seconds: int = KEEP_ALIVE_INTERVAL,
         token_service: Optional[TokenService] = None,
         websocket_manager: Optional[WebSocketManager] = None,
-        http_client: Optional[httpx.AsyncClient] = None
+        http_client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = KEEP_ALIVE_CONCURRENCY,
+        min_interval: int = KEEP_ALIVE_MIN_INTERVAL,
+        max_interval: int = KEEP_ALIVE_MAX_INTERVAL
     ):
         """
         初始化Token保活服务
@@ -77,8 +136,16 @@ class TokenKeeper:
             token_service: Token服务实例，如果不提供则使用全局实例
             websocket_manager: WebSocket管理器实例，如果不提供则使用全局实例
             http_client: HTTP客户端实例，如果不提供则自动创建
+            concurrency: 单轮保活的最大并发请求数，默认从配置读取
+            min_interval: 自适应调整时保活间隔的下限（秒）
+            max_interval: 自适应调整时保活间隔的上限（秒）
         """
         self._interval = interval_seconds
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        # 最近几轮保活的失效数量，用于自适应调整间隔
+        self._recent_expired: deque = deque(maxlen=ADAPTIVE_WINDOW)
+        self._concurrency = max(1, concurrency)
         self._token_service = token_service
         self._websocket_manager = websocket_manager
         self._http_client = http_client
@@ -87,6 +154,29 @@ class TokenKeeper:
         # 运行状态
         self._running = False
         self._task: Optional[asyncio.Task] = None
+        # 唤醒等待中的保活循环（停止服务或调整间隔时设置）
+        self._wake_event = asyncio.Event()
+        
+        # 有效性校验缓存: token_id -> (校验时的Token值, 校验结果, 校验时间monotonic)
+        self._verify_cache: Dict[int, Tuple[str, bool, float]] = {}
+        # 每个Token一把锁，保证同一Token同时最多只有一个校验请求在途
+        self._verify_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        # 固定请求头只构建一次，每次请求只追加Token
+        self._agent_headers = {**AGENT_KEEP_ALIVE_HEADERS, **BROWSER_HEADERS}
+        self._network_headers = {**NETWORK_KEEP_ALIVE_HEADERS, **BROWSER_HEADERS}
+        
+        # 网点保活请求体只随日期变化，按日期缓存
+        self._network_body_date: Optional[str] = None
+        self._network_body: dict = {}
+        
+        # 按账号类型分派有效性检测，未知类型按代理区处理
+        self._checkers: Dict[AccountType, Callable[[str], Awaitable[bool]]] = {
+            AccountType.AGENT: self.check_token_validity,
+            AccountType.NETWORK: self.check_network_token_validity,
+        }
+        
+        # 解密结果缓存: 密文 -> 明文。Token更新后密文随之变化，旧条目自然失效
+        self._decrypt_cache: Dict[str, str] = {}
         
         # 统计信息
         self._stats = {
@@ -94,6 +184,7 @@ class TokenKeeper:
             "successful_checks": 0,
             "failed_checks": 0,
             "expired_tokens": 0,
+            "cache_hits": 0,
             "last_check_time": None
         }
         
@@ -115,10 +206,28 @@ class TokenKeeper:
     
     @property
     def http_client(self) -> httpx.AsyncClient:
-        """获取HTTP客户端实例"""
+        """
+        获取HTTP客户端实例
+        
+        连接空闲保留时间覆盖保活间隔的上限，自适应调整把间隔拉长后
+        相邻两轮保活仍复用同一批连接，避免每轮都重新进行TLS握手；启用HTTP/2后同一主机的并发请求复用一条连接，
+        服务端不支持时自动回退到HTTP/1.1。建立连接失败（DNS、TCP）由传输层重试，
+        重试后仍失败才作为临时失败交给调用方处理
+        """
         if self._http_client is None:
+            # 指定transport后客户端的limits/http2参数不再生效，需配置在transport上
+            transport = httpx.AsyncHTTPTransport(
+                retries=HTTP_CONNECT_RETRIES,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=256,
+                    max_keepalive_connections=64,
+                    keepalive_expiry=max(15, max(self._interval, self._max_interval) + 5)
+                )
+            )
             self._http_client = httpx.AsyncClient(
-                timeout=httpx.Timeout(30.0),
+                transport=transport,
+                timeout=httpx.Timeout(connect=5.0, read=20.0, write=10.0, pool=5.0),
                 follow_redirects=True
             )
         return self._http_client
@@ -165,14 +274,17 @@ class TokenKeeper:
             return
         
         self._running = False
+        self._wake_event.set()
         
-        # 取消任务
+        # 等待中的循环被唤醒后直接退出；正在执行保活的循环则取消
         if self._task:
-            self._task.cancel()
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
+            done, _ = await asyncio.wait({self._task}, timeout=STOP_GRACE_SECONDS)
+            if not done:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
             self._task = None
         
         # 关闭HTTP客户端
@@ -182,6 +294,23 @@ class TokenKeeper:
         
         logger.info("TokenKeeper保活服务已停止")
     
+    async def _wait_interval(self) -> bool:
+        """
+        等待一个保活间隔
+        
+        服务停止时立即返回；间隔被调整时按新间隔重新计时
+        
+        Returns:
+            bool: True表示间隔到期应执行保活，False表示服务已停止
+        """
+        while self._running:
+            self._wake_event.clear()
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                return self._running
+        return False
+    
     async def _keep_alive_loop(self) -> None:
         """
         保活循环
@@ -194,14 +323,15 @@ class TokenKeeper:
         
         while self._running:
             try:
-                # 等待指定间隔
-                await asyncio.sleep(self._interval)
-                
-                if not self._running:
+                # 等待指定间隔，期间服务停止则直接退出
+                if not await self._wait_interval():
                     break
                 
                 # 执行一轮保活
-                await self.run_keep_alive_cycle()
+                cycle_stats = await self.run_keep_alive_cycle()
+                
+                # 根据本轮结果调整下一轮间隔
+                self.adapt_interval(cycle_stats)
                 
             except asyncio.CancelledError:
                 logger.info("保活循环被取消")
@@ -214,7 +344,7 @@ class TokenKeeper:
         """
         执行一轮保活循环
         
-        获取所有活跃Token并逐个执行保活操作
+        获取所有活跃Token并发执行保活操作，同时在途的请求数不超过concurrency
         
         Returns:
             dict: 本轮保活结果统计
@@ -232,7 +362,7 @@ class TokenKeeper:
         
         try:
             # 获取所有活跃Token
-            active_tokens = self.token_service.get_active_tokens()
+            active_tokens = list(self.token_service.iter_active_for_keeper())
             cycle_stats["total"] = len(active_tokens)
             
             if not active_tokens:
@@ -241,36 +371,71 @@ class TokenKeeper:
             
             logger.info(f"发现{len(active_tokens)}个活跃Token需要保活")
             
-            # 逐个执行保活
-            for token in active_tokens:
-                try:
-                    # 解密Token
-                    decrypted_token = decrypt_token(token.token_value)
-                    
+            # 解密（未缓存的在线程池中批量解密，避免阻塞事件循环）
+            decrypted_tokens = await self._decrypt_tokens(
+                [token.token_value for token in active_tokens]
+            )
+            
+            # 并发执行保活，信号量限制同时在途的请求数
+            semaphore = asyncio.Semaphore(self._concurrency)
+            
+            async def probe_one(token: Row, decrypted_token: Union[str, Exception]) -> bool:
+                if isinstance(decrypted_token, Exception):
+                    raise decrypted_token
+                
+                async with semaphore:
                     # 获取账号类型
                     account_type = token.account_type or AccountType.AGENT
                     
-                    # 执行保活
-                    is_valid = await self.keep_alive(token.id, decrypted_token, account_type)
-                    
-                    if is_valid:
-                        cycle_stats["success"] += 1
-                        self._stats["successful_checks"] += 1
-                    else:
-                        cycle_stats["expired"] += 1
-                        self._stats["expired_tokens"] += 1
-                        
-                        # 发送失效通知
-                        await self.notify_token_expired(token.user_id, "保活检测失败，Token已过期")
-                        
-                except Exception as e:
-                    logger.error(f"Token保活失败: user_id={token.user_id}, type={token.account_type}, error={str(e)}")
-                    cycle_stats["failed"] += 1
-                    self._stats["failed_checks"] += 1
+                    # 只做有效性检测，数据库写回在本轮结束后统一进行
+                    return await self.verify_token(token.id, decrypted_token, account_type)
+            
+            results = await asyncio.gather(
+                *[probe_one(token, decrypted) for token, decrypted in zip(active_tokens, decrypted_tokens)],
+                return_exceptions=True
+            )
+            
+            # 按结果分组
+            active_ids: List[int] = []
+            expired_tokens: List[Row] = []
+            for token, result in zip(active_tokens, results):
+                if isinstance(result, Exception):
+                    # 保活失败不改变Token状态，等待下次重试
+                    logger.error(f"Token保活失败: user_id={token.user_id}, type={token.account_type}, error={str(result)}")
+                elif result:
+                    active_ids.append(token.id)
+                else:
+                    expired_tokens.append(token)
+            
+            cycle_stats["success"] = len(active_ids)
+            cycle_stats["expired"] = len(expired_tokens)
+            cycle_stats["failed"] = cycle_stats["total"] - cycle_stats["success"] - cycle_stats["expired"]
+            
+            # 一次事务写回本轮结果
+            cycle_now = get_china_now()
+            self.token_service.bulk_touch(
+                active_ids,
+                [(token.id, token.token_value) for token in expired_tokens],
+                now=cycle_now
+            )
             
-            # 更新统计
+            # 发送失效通知
+            if expired_tokens:
+                for token in expired_tokens:
+                    logger.warning(f"Token已过期: id={token.id}, type={token.account_type}")
+                await self.notify_expired_users(
+                    [token.user_id for token in expired_tokens], "保活检测失败，Token已过期"
+                )
+            
+            # 本轮结束后释放空闲的Token锁
+            self._prune_verify_locks()
+            
+            # 更新统计（每轮只合并一次）
             self._stats["total_checks"] += cycle_stats["total"]
-            self._stats["last_check_time"] = get_china_now().isoformat()
+            self._stats["successful_checks"] += cycle_stats["success"]
+            self._stats["expired_tokens"] += cycle_stats["expired"]
+            self._stats["failed_checks"] += cycle_stats["failed"]
+            self._stats["last_check_time"] = cycle_now.isoformat()
             
             logger.info(
                 f"保活循环完成: 总数={cycle_stats['total']}, "
@@ -303,19 +468,17 @@ class TokenKeeper:
             
         Requirements: 5.2, 5.3, 5.4
         """
-        logger.debug(f"执行Token保活: id={token_id}, type={account_type.value}, token={mask_token(token)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"执行Token保活: id={token_id}, type={account_type.value}, token={mask_token(token)}")
         
         try:
-            # 根据账号类型选择保活方式
-            if account_type == AccountType.NETWORK:
-                is_valid = await self.check_network_token_validity(token)
-            else:
-                is_valid = await self.check_token_validity(token)
+            is_valid = await self.verify_token(token_id, token, account_type)
             
             if is_valid:
                 # Token有效，更新最后活跃时间
                 self.token_service.update_last_active(token_id)
-                logger.info(f"Token保活成功: id={token_id}, type={account_type.value}")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"Token保活成功: id={token_id}, type={account_type.value}")
                 return True
             else:
                 # Token无效，标记为过期
@@ -328,6 +491,116 @@ class TokenKeeper:
             # 保活失败不改变Token状态，等待下次重试
             raise
     
+    async def probe_token(self, token: str, account_type: AccountType = AccountType.AGENT) -> bool:
+        """
+        按账号类型检测Token有效性，不写数据库
+        
+        Args:
+            token: 解密后的Token值
+            account_type: 账号类型
+            
+        Returns:
+            bool: Token是否有效
+        """
+        checker = self._checkers.get(account_type, self.check_token_validity)
+        return await checker(token)
+    
+    async def _decrypt_tokens(self, values: List[str]) -> List[Union[str, Exception]]:
+        """
+        批量解密Token，密文未变化的直接复用上次的解密结果
+        
+        Args:
+            values: 加密后的Token值列表
+            
+        Returns:
+            List[Union[str, Exception]]: 与输入一一对应的解密结果，失败项为异常对象
+        """
+        misses = [value for value in dict.fromkeys(values) if value not in self._decrypt_cache]
+        failures: Dict[str, Exception] = {}
+        
+        if misses:
+            loop = asyncio.get_running_loop()
+            decrypted = await loop.run_in_executor(None, _decrypt_many, misses)
+            for value, result in zip(misses, decrypted):
+                if isinstance(result, Exception):
+                    failures[value] = result
+                    continue
+                if len(self._decrypt_cache) >= DECRYPT_CACHE_MAXSIZE:
+                    # 淘汰最早写入的条目
+                    self._decrypt_cache.pop(next(iter(self._decrypt_cache)))
+                self._decrypt_cache[value] = result
+        
+        return [
+            failures[value] if value in failures else self._decrypt_cache[value]
+            for value in values
+        ]
+    
+    @property
+    def verify_ttl(self) -> int:
+        """有效性校验结果的缓存时长（秒），取保活间隔的一半"""
+        return max(1, self._interval // 2)
+    
+    def _cached_verdict(self, token_id: int, token: str) -> bool:
+        """缓存中是否有同一Token值未过期的校验通过记录，命中时计数"""
+        entry = self._verify_cache.get(token_id)
+        if entry is None:
+            return False
+        cached_token, verdict, verified_at = entry
+        if verdict and cached_token == token and time.monotonic() - verified_at < self.verify_ttl:
+            self._stats["cache_hits"] += 1
+            return True
+        return False
+    
+    def _prune_verify_locks(self) -> None:
+        """清理当前未被持有的Token锁"""
+        for token_id in [tid for tid, lock in self._verify_locks.items() if not lock.locked()]:
+            del self._verify_locks[token_id]
+    
+    async def verify_token(self, token_id: int, token: str, account_type: AccountType = AccountType.AGENT) -> bool:
+        """
+        检测Token有效性，短时间内校验通过过的Token直接复用结果
+        
+        缓存按Token值记录最近一次校验结果，Token被重新上传后旧结果不再适用；
+        只有有效结果会在TTL内直接复用。同一Token的并发校验通过锁串行化，
+        拿到锁后再次检查缓存，避免重复请求。
+        请求临时失败时沿用同一Token值的上次校验结果（无论有效与否），
+        没有记录时保守视为有效，两种情况都不刷新缓存
+        
+        Args:
+            token_id: Token ID
+            token: 解密后的Token值
+            account_type: 账号类型
+            
+        Returns:
+            bool: Token是否有效
+        """
+        if self._cached_verdict(token_id, token):
+            return True
+        
+        async with self._verify_locks[token_id]:
+            # 等锁期间其他协程可能已完成校验，再检查一次
+            if self._cached_verdict(token_id, token):
+                return True
+            
+            try:
+                is_valid = await self.probe_token(token, account_type)
+            except TransientCheckError as e:
+                entry = self._verify_cache.get(token_id)
+                if entry is not None and entry[0] == token:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"保活请求临时失败，沿用上次校验结果: id={token_id}, valid={entry[1]}, error={str(e)}")
+                    return entry[1]
+                logger.warning(f"保活请求临时失败，无历史校验结果，保守视为有效: id={token_id}, error={str(e)}")
+                return True
+            
+            self._verify_cache.pop(token_id, None)
+            if len(self._verify_cache) >= VERIFY_CACHE_MAXSIZE:
+                # 淘汰最早写入的条目
+                self._verify_cache.pop(next(iter(self._verify_cache)))
+            self._verify_cache[token_id] = (token, is_valid, time.monotonic())
+        
+        return is_valid
+    
     async def check_token_validity(self, token: str) -> bool:
         """
         检查代理区Token是否有效
@@ -340,18 +613,15 @@ class TokenKeeper:
         Returns:
             bool: Token是否有效
             
+        Raises:
+            TransientCheckError: 请求超时或网络错误
+            
         Requirements: 5.2
         """
         api_url = AGENT_KEEP_ALIVE_URL
         
         # 构建请求头 - 代理区使用 authtoken (小写)
-        headers = {
-            **AGENT_KEEP_ALIVE_HEADERS,
-            "authtoken": token,
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        }
+        headers = {**self._agent_headers, "authtoken": token}
         
         try:
             response = await self.http_client.get(api_url, headers=headers)
@@ -371,7 +641,8 @@ class TokenKeeper:
                     data = response.json()
                     # checkToken API 返回 code=1 表示Token有效
                     if data.get("code") == 1 or data.get("succ") is True:
-                        logger.debug(f"代理区Token验证成功: token={mask_token(token)}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"代理区Token验证成功: token={mask_token(token)}")
                         return True
                     else:
                         msg = data.get("msg", "")
@@ -385,13 +656,32 @@ class TokenKeeper:
             return True  # 保守处理
             
         except httpx.TimeoutException:
-            logger.warning(f"代理区保活请求超时: token={mask_token(token)}")
-            return True  # 超时不认为Token失效
+            # 超时不认为Token失效，由调用方决定沿用的结果
+            raise TransientCheckError(f"代理区保活请求超时: token={mask_token(token)}")
             
         except httpx.RequestError as e:
-            logger.error(f"代理区保活请求失败: {str(e)}")
-            return True  # 网络错误不认为Token失效
+            # 网络错误不认为Token失效，由调用方决定沿用的结果
+            raise TransientCheckError(f"代理区保活请求失败: {str(e)}")
 
+    def _get_network_body(self) -> dict:
+        """
+        获取网点保活请求体
+        
+        查询范围为昨天全天，同一天内复用同一个请求体
+        
+        Returns:
+            dict: 请求体
+        """
+        yesterday = (get_china_now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        if yesterday != self._network_body_date:
+            self._network_body = {
+                **NETWORK_KEEP_ALIVE_BODY,
+                "startTime": f"{yesterday} 00:00:00",
+                "endTime": f"{yesterday} 23:59:59",
+            }
+            self._network_body_date = yesterday
+        return self._network_body
+    
     async def check_network_token_validity(self, token: str) -> bool:
         """
         检查网点Token是否有效
@@ -403,26 +693,16 @@ class TokenKeeper:
             
         Returns:
             bool: Token是否有效
+            
+        Raises:
+            TransientCheckError: 请求超时或网络错误
         """
         api_url = NETWORK_KEEP_ALIVE_URL
         
-        # 构建请求头
-        headers = {
-            **NETWORK_KEEP_ALIVE_HEADERS,
-            "authToken": token,  # 网点使用驼峰命名
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        }
+        # 构建请求头 - 网点使用驼峰命名 authToken
+        headers = {**self._network_headers, "authToken": token}
         
-        # 构建请求体（添加动态日期）
-        now = get_china_now()
-        yesterday = now - timedelta(days=1)
-        body = {
-            **NETWORK_KEEP_ALIVE_BODY,
-            "startTime": yesterday.strftime("%Y-%m-%d 00:00:00"),
-            "endTime": yesterday.strftime("%Y-%m-%d 23:59:59"),
-        }
+        body = self._get_network_body()
         
         try:
             response = await self.http_client.post(api_url, headers=headers, json=body)
@@ -442,7 +722,8 @@ class TokenKeeper:
                     data = response.json()
                     # 网点API返回 code=1 表示成功
                     if data.get("code") == 1 or data.get("succ") is True:
-                        logger.debug(f"网点Token验证成功: token={mask_token(token)}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"网点Token验证成功: token={mask_token(token)}")
                         return True
                     else:
                         logger.warning(f"网点Token验证失败: code={data.get('code')}, msg={data.get('msg')}")
@@ -458,12 +739,10 @@ class TokenKeeper:
             return True  # 保守处理
             
         except httpx.TimeoutException:
-            logger.warning(f"网点保活请求超时: token={mask_token(token)}")
-            return True
+            raise TransientCheckError(f"网点保活请求超时: token={mask_token(token)}")
             
         except httpx.RequestError as e:
-            logger.error(f"网点保活请求失败: {str(e)}")
-            return True
+            raise TransientCheckError(f"网点保活请求失败: {str(e)}")
 
     def _check_response_validity(self, response: httpx.Response, token: str) -> bool:
         """检查HTTP响应判断Token有效性"""
@@ -476,13 +755,20 @@ class TokenKeeper:
             return False
         
         if 200 <= response.status_code < 400:
-            logger.debug(f"Token验证成功: token={mask_token(token)}, status={response.status_code}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Token验证成功: token={mask_token(token)}, status={response.status_code}")
             return True
         
         logger.warning(f"保活请求返回异常状态码: {response.status_code}")
         return True  # 保守处理
 
-    async def notify_token_expired(self, user_id: str, reason: str = "Token已过期") -> bool:
+    async def notify_token_expired(
+        self,
+        user_id: str,
+        reason: str = "Token已过期",
+        conn_info: Optional[ConnectionInfo] = None,
+        frame: Optional[str] = None
+    ) -> bool:
         """
         发送Token失效通知
         
@@ -491,6 +777,8 @@ class TokenKeeper:
         Args:
             user_id: 用户标识
             reason: 失效原因
+            conn_info: 已查好的连接信息，提供时跳过按用户查找
+            frame: 已序列化的通知消息，提供时直接发送
             
         Returns:
             bool: 是否成功发送通知
@@ -501,20 +789,24 @@ class TokenKeeper:
         
         try:
             # 查找用户关联的WebSocket连接
-            conn_info = self.websocket_manager.get_connection_by_user(user_id)
+            if conn_info is None:
+                conn_info = self.websocket_manager.get_connection_by_user(user_id)
             
             if conn_info is None:
                 logger.warning(f"未找到用户的WebSocket连接: user_id={user_id}")
                 return False
             
-            # 创建失效通知消息
-            message = create_token_expired_message(user_id, reason)
-            
             # 发送消息
-            success = await self.websocket_manager.send_to_extension(
-                conn_info.extension_id,
-                message
-            )
+            if frame is not None:
+                success = await self.websocket_manager.send_text_to_extension(
+                    conn_info.extension_id,
+                    frame
+                )
+            else:
+                success = await self.websocket_manager.send_to_extension(
+                    conn_info.extension_id,
+                    create_token_expired_message(user_id, reason)
+                )
             
             if success:
                 logger.info(f"Token失效通知已发送: user_id={user_id}, extension_id={conn_info.extension_id}")
@@ -527,11 +819,41 @@ class TokenKeeper:
             logger.error(f"发送Token失效通知失败: user_id={user_id}, error={str(e)}")
             return False
     
+    async def notify_expired_users(self, user_ids: List[str], reason: str = "Token已过期") -> int:
+        """
+        并发向多个用户发送Token失效通知
+        
+        一次性取出所有用户的连接，消息按模板批量序列化后并发发送
+        
+        Args:
+            user_ids: 用户标识列表
+            reason: 失效原因
+            
+        Returns:
+            int: 成功发送通知的数量
+        """
+        connections = self.websocket_manager.get_connections_by_users(user_ids)
+        
+        for user_id in user_ids:
+            if user_id not in connections:
+                logger.warning(f"未找到用户的WebSocket连接: user_id={user_id}")
+        
+        frames = serialize_token_expired_messages(connections, reason)
+        
+        results = await asyncio.gather(
+            *[
+                self.notify_token_expired(user_id, reason, conn_info, frames[user_id])
+                for user_id, conn_info in connections.items()
+            ],
+            return_exceptions=True
+        )
+        return sum(1 for result in results if result is True)
+    
     async def notify_all_expired_tokens(self) -> int:
         """
         通知所有已过期Token的用户
         
-        遍历所有过期状态的Token，向关联的插件发送失效通知
+        找出所有过期状态的Token，并发向关联的插件发送失效通知
         
         Returns:
             int: 成功发送通知的数量
@@ -539,11 +861,8 @@ class TokenKeeper:
         success_count = 0
         
         try:
-            # 获取所有Token（包括过期的）
-            all_tokens = self.token_service.get_all(include_expired=True)
-            
-            # 筛选过期Token
-            expired_tokens = [t for t in all_tokens if t.status == TokenStatus.EXPIRED]
+            # 获取过期Token
+            expired_tokens = self.token_service.get_by_status(TokenStatus.EXPIRED)
             
             if not expired_tokens:
                 logger.info("没有过期Token需要通知")
@@ -551,9 +870,9 @@ class TokenKeeper:
             
             logger.info(f"发现{len(expired_tokens)}个过期Token需要通知")
             
-            for token in expired_tokens:
-                if await self.notify_token_expired(token.user_id, "Token已过期"):
-                    success_count += 1
+            success_count = await self.notify_expired_users(
+                [token.user_id for token in expired_tokens], "Token已过期"
+            )
             
             logger.info(f"过期Token通知完成: 成功={success_count}/{len(expired_tokens)}")
             return success_count
@@ -562,10 +881,47 @@ class TokenKeeper:
             logger.error(f"批量发送过期通知失败: {str(e)}")
             return success_count
     
+    def adapt_interval(self, cycle_stats: dict) -> int:
+        """
+        根据保活结果自适应调整保活间隔
+        
+        出现失效Token时间隔减半，以便尽快发现后续失效；连续ADAPTIVE_WINDOW轮
+        无失效时间隔放宽为1.5倍，减少稳定期的请求量。结果限制在
+        [min_interval, max_interval] 范围内；通过set_interval设置的间隔即为上限，
+        自适应调整不会超过它
+        
+        Args:
+            cycle_stats: run_keep_alive_cycle返回的本轮统计
+            
+        Returns:
+            int: 调整后的保活间隔（秒）
+        """
+        expired = cycle_stats.get("expired", 0)
+        self._recent_expired.append(expired)
+        
+        if expired > 0:
+            new_interval = max(self._min_interval, self._interval // 2)
+        elif len(self._recent_expired) == ADAPTIVE_WINDOW and not any(self._recent_expired):
+            new_interval = min(self._max_interval, int(self._interval * ADAPTIVE_BACKOFF))
+        else:
+            return self._interval
+        
+        # 调整后重新开始统计
+        self._recent_expired.clear()
+        
+        if new_interval != self._interval:
+            logger.info(f"保活间隔自适应调整: {self._interval}秒 -> {new_interval}秒, 本轮失效={expired}")
+            self._interval = new_interval
+        
+        return self._interval
+    
     def set_interval(self, interval_seconds: int) -> None:
         """
         设置保活间隔
         
+        设置的间隔同时作为自适应调整的上限：出现失效时仍会缩短间隔，
+        但稳定后最多放宽回该值，不会超过显式设置的间隔
+        
         Args:
             interval_seconds: 新的保活间隔（秒）
         """
@@ -573,7 +929,12 @@ class TokenKeeper:
             logger.warning(f"保活间隔过短，建议至少60秒: {interval_seconds}")
         
         self._interval = interval_seconds
-        logger.info(f"保活间隔已更新: {interval_seconds}秒")
+        self._max_interval = interval_seconds
+        self._min_interval = min(self._min_interval, interval_seconds)
+        self._recent_expired.clear()
+        # 唤醒等待中的循环，按新间隔重新计时
+        self._wake_event.set()
+        logger.info(f"保活间隔已更新: {interval_seconds}秒（自适应调整上限）")
     
     def reset_stats(self) -> None:
         """重置统计信息"""
@@ -582,9 +943,15 @@ class TokenKeeper:
             "successful_checks": 0,
             "failed_checks": 0,
             "expired_tokens": 0,
+            "cache_hits": 0,
             "last_check_time": None
         }
         logger.info("统计信息已重置")
+    
+    def reset_verify_cache(self) -> None:
+        """清空有效性校验缓存"""
+        self._verify_cache.clear()
+        self._prune_verify_locks()
 
 
 # 全局TokenKeeper实例（单例模式）
@@ -5,8 +5,9 @@ Token服务核心逻辑模块
 
 import logging
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Iterator, Tuple
 
+from sqlalchemy import select, update, tuple_, Row
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -45,6 +46,7 @@ class TokenService:
     - 删除Token
     - 更新Token状态
     - 更新最后活跃时间
+    - 批量更新保活结果
     """
     
     def __init__(self, session: Optional[Session] = None):
@@ -211,6 +213,22 @@ class TokenService:
             logger.error(f"查询Token列表失败: {str(e)}")
             raise TokenServiceError(f"查询Token列表失败: {str(e)}")
     
+    def get_by_status(self, status: TokenStatus) -> List[Token]:
+        """
+        获取指定状态的Token
+        
+        Args:
+            status: Token状态
+            
+        Returns:
+            List[Token]: Token列表
+        """
+        try:
+            return self.session.query(Token).filter(Token.status == status).all()
+        except SQLAlchemyError as e:
+            logger.error(f"按状态查询Token失败: status={status.value}, error={str(e)}")
+            raise TokenServiceError(f"按状态查询Token失败: {str(e)}")
+    
     def get_by_user(self, user_id: str) -> Optional[Token]:
         """
         根据用户ID获取Token
@@ -240,9 +258,7 @@ class TokenService:
             Optional[Token]: Token对象，如果不存在则返回None
         """
         try:
-            return self.session.query(Token).filter(
-                Token.id == token_id
-            ).first()
+            return self.session.get(Token, token_id)
         except SQLAlchemyError as e:
             logger.error(f"查询Token失败: id={token_id}, error={str(e)}")
             raise TokenServiceError(f"查询Token失败: {str(e)}")
@@ -262,9 +278,7 @@ class TokenService:
             TokenServiceError: 数据库操作失败
         """
         try:
-            token = self.session.query(Token).filter(
-                Token.id == token_id
-            ).first()
+            token = self.session.get(Token, token_id)
             
             if token is None:
                 logger.warning(f"删除Token失败: Token不存在, id={token_id}")
@@ -334,9 +348,7 @@ class TokenService:
             TokenServiceError: 数据库操作失败
         """
         try:
-            token = self.session.query(Token).filter(
-                Token.id == token_id
-            ).first()
+            token = self.session.get(Token, token_id)
             
             if token is None:
                 logger.warning(f"更新Token状态失败: Token不存在, id={token_id}")
@@ -356,12 +368,13 @@ class TokenService:
             logger.error(f"更新Token状态失败: id={token_id}, error={str(e)}")
             raise TokenServiceError(f"更新Token状态失败: {str(e)}")
     
-    def update_last_active(self, token_id: int) -> bool:
+    def update_last_active(self, token_id: int, now: Optional[datetime] = None) -> bool:
         """
         更新Token最后活跃时间
         
         Args:
             token_id: Token ID
+            now: 写入的时间，不提供则取当前时间
             
         Returns:
             bool: 是否更新成功
@@ -371,16 +384,15 @@ class TokenService:
             TokenServiceError: 数据库操作失败
         """
         try:
-            token = self.session.query(Token).filter(
-                Token.id == token_id
-            ).first()
+            token = self.session.get(Token, token_id)
             
             if token is None:
                 logger.warning(f"更新活跃时间失败: Token不存在, id={token_id}")
                 raise TokenNotFoundError(f"Token不存在: id={token_id}")
             
-            token.last_active_at = get_china_now()
-            token.updated_at = get_china_now()
+            now = now or get_china_now()
+            token.last_active_at = now
+            token.updated_at = now
             self.session.commit()
             logger.info(f"更新Token活跃时间: id={token_id}")
             return True
@@ -392,6 +404,61 @@ class TokenService:
             logger.error(f"更新活跃时间失败: id={token_id}, error={str(e)}")
             raise TokenServiceError(f"更新活跃时间失败: {str(e)}")
     
+    def bulk_touch(
+        self,
+        active_ids: List[int],
+        expired: List[Tuple[int, str]],
+        now: Optional[datetime] = None
+    ) -> int:
+        """
+        批量写回一轮保活的结果
+        
+        有效Token刷新最后活跃时间，失效Token标记为过期，
+        两条UPDATE语句在同一个事务中提交
+        
+        失效Token只有在token_value仍是检测时的值才会被标记，
+        检测期间被重新上传的Token保持不变
+        
+        Args:
+            active_ids: 保活成功的Token ID列表
+            expired: 已失效Token的(ID, 检测时的加密token_value)列表
+            now: 写入的时间，不提供则取当前时间
+            
+        Returns:
+            int: 受影响的行数
+            
+        Raises:
+            TokenServiceError: 数据库操作失败
+        """
+        if not active_ids and not expired:
+            return 0
+        
+        now = now or get_china_now()
+        affected = 0
+        try:
+            if active_ids:
+                result = self.session.execute(
+                    update(Token)
+                    .where(Token.id.in_(active_ids))
+                    .values(last_active_at=now, updated_at=now)
+                )
+                affected += result.rowcount
+            if expired:
+                result = self.session.execute(
+                    update(Token)
+                    .where(tuple_(Token.id, Token.token_value).in_(expired))
+                    .values(status=TokenStatus.EXPIRED, updated_at=now)
+                )
+                affected += result.rowcount
+            self.session.commit()
+            logger.info(f"批量更新保活结果: 活跃={len(active_ids)}, 过期={len(expired)}")
+            return affected
+            
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            logger.error(f"批量更新保活结果失败: error={str(e)}")
+            raise TokenServiceError(f"批量更新保活结果失败: {str(e)}")
+    
     def update_network_info(
         self, 
         token_id: int, 
@@ -416,9 +483,7 @@ class TokenService:
             TokenServiceError: 数据库操作失败
         """
         try:
-            token = self.session.query(Token).filter(
-                Token.id == token_id
-            ).first()
+            token = self.session.get(Token, token_id)
             
             if token is None:
                 logger.warning(f"更新网点信息失败: Token不存在, id={token_id}")
@@ -458,6 +523,29 @@ class TokenService:
             return None
         return decrypt_token(token.token_value)
     
+    def iter_active_for_keeper(self, batch_size: int = 200) -> Iterator[Row]:
+        """
+        流式获取保活所需的活跃Token字段
+        
+        只查询 id、user_id、token_value、account_type 四列，不构建ORM对象
+        
+        Args:
+            batch_size: 每批从数据库读取的行数
+            
+        Returns:
+            Iterator[Row]: 可按属性访问上述四列的行
+        """
+        try:
+            result = self.session.execute(
+                select(Token.id, Token.user_id, Token.token_value, Token.account_type)
+                .where(Token.status == TokenStatus.ACTIVE)
+                .execution_options(yield_per=batch_size)
+            )
+            yield from result
+        except SQLAlchemyError as e:
+            logger.error(f"查询活跃Token失败: {str(e)}")
+            raise TokenServiceError(f"查询活跃Token失败: {str(e)}")
+    
     def get_active_tokens(self) -> List[Token]:
         """
         获取所有活跃状态的Token
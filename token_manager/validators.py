@@ -4,14 +4,70 @@ Token格式验证模块
 """
 
 import re
-from typing import Tuple
+import string
+from functools import lru_cache
+from typing import Iterable, List, Tuple
 
 
 # Token格式要求
 MIN_TOKEN_LENGTH = 10  # 最小长度
 MAX_TOKEN_LENGTH = 500  # 最大长度
-# Token允许的字符集：字母、数字、下划线、连字符、点、等号（base64常见字符）
-TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_\-\.=+/]+$')
+MAX_USER_ID_LENGTH = 64  # 用户ID最大长度
+# Token允许的符号（字母、数字之外）：下划线、连字符、点、等号、加号、斜杠（base64常见字符）
+TOKEN_SYMBOLS = "_-.=+/"
+# Token允许的字符集合，下面的字节表和批量验证正则都由它生成
+TOKEN_CHARS = frozenset(string.ascii_letters + string.digits + TOKEN_SYMBOLS)
+# 字符集的字节形式：ASCII Token删去这些字节后为空即合法，整个检查在C层完成
+_TOKEN_BYTES = "".join(sorted(TOKEN_CHARS)).encode("ascii")
+# 批量验证用的正则，字符集与长度限制一次匹配完成
+TOKEN_BATCH_PATTERN = re.compile(
+    f"[{re.escape(''.join(sorted(TOKEN_CHARS)))}]{{{MIN_TOKEN_LENGTH},{MAX_TOKEN_LENGTH}}}"
+)
+
+# 验证结果缓存的最大条目数
+VALIDATION_CACHE_SIZE = 4096
+# 超过该长度的输入不进入缓存，避免超长字符串长期占用内存
+_CACHEABLE_MAX_LENGTH = MAX_TOKEN_LENGTH * 2
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _validate_token_impl(token: str) -> Tuple[bool, str]:
+    """Token格式验证（纯函数，结果可缓存），调用方已排除None"""
+    # 首尾有空白时才去除，已规整的Token不再复制一份
+    if token and (token[0].isspace() or token[-1].isspace()):
+        token = token.strip()
+    
+    # 检查纯空白
+    if not token:
+        return False, "Token不能为空或纯空白"
+    
+    # 检查长度
+    if len(token) < MIN_TOKEN_LENGTH:
+        return False, f"Token长度不能小于{MIN_TOKEN_LENGTH}个字符"
+    
+    if len(token) > MAX_TOKEN_LENGTH:
+        return False, f"Token长度不能超过{MAX_TOKEN_LENGTH}个字符"
+    
+    # 检查字符集
+    if not token.isascii() or token.encode("ascii").translate(None, _TOKEN_BYTES):
+        return False, f"Token包含非法字符，只允许字母、数字和特定符号({TOKEN_SYMBOLS})"
+    
+    return True, ""
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _validate_user_id_impl(user_id: str) -> Tuple[bool, str]:
+    """用户ID格式验证（纯函数，结果可缓存），调用方已排除None"""
+    if user_id and (user_id[0].isspace() or user_id[-1].isspace()):
+        user_id = user_id.strip()
+    
+    if not user_id:
+        return False, "用户ID不能为空或纯空白"
+    
+    if len(user_id) > MAX_USER_ID_LENGTH:
+        return False, f"用户ID长度不能超过{MAX_USER_ID_LENGTH}个字符"
+    
+    return True, ""
 
 
 def validate_token(token: str) -> Tuple[bool, str]:
@@ -23,6 +79,8 @@ def validate_token(token: str) -> Tuple[bool, str]:
     2. Token长度必须在MIN_TOKEN_LENGTH到MAX_TOKEN_LENGTH之间
     3. Token只能包含允许的字符集
     
+    同一Token的验证结果会被缓存
+    
     Args:
         token: 待验证的Token字符串
         
@@ -33,25 +91,10 @@ def validate_token(token: str) -> Tuple[bool, str]:
     if token is None:
         return False, "Token不能为空"
     
-    # 检查纯空白
-    if not token or not token.strip():
-        return False, "Token不能为空或纯空白"
-    
-    # 去除首尾空白后检查
-    token = token.strip()
-    
-    # 检查长度
-    if len(token) < MIN_TOKEN_LENGTH:
-        return False, f"Token长度不能小于{MIN_TOKEN_LENGTH}个字符"
-    
-    if len(token) > MAX_TOKEN_LENGTH:
-        return False, f"Token长度不能超过{MAX_TOKEN_LENGTH}个字符"
-    
-    # 检查字符集
-    if not TOKEN_PATTERN.match(token):
-        return False, "Token包含非法字符，只允许字母、数字和特定符号(_-.=+/)"
+    if len(token) > _CACHEABLE_MAX_LENGTH:
+        return _validate_token_impl.__wrapped__(token)
     
-    return True, ""
+    return _validate_token_impl(token)
 
 
 def is_valid_token(token: str) -> bool:
@@ -68,10 +111,32 @@ def is_valid_token(token: str) -> bool:
     return valid
 
 
+def validate_tokens(tokens: Iterable[str]) -> List[bool]:
+    """
+    批量验证Token格式有效性
+    
+    规则与validate_token一致，但不返回错误信息也不经过缓存，
+    每个Token只做一次去空白和一次正则全匹配，适合批量导入等场景
+    
+    Args:
+        tokens: 待验证的Token字符串序列
+        
+    Returns:
+        List[bool]: 与输入顺序一致的验证结果
+    """
+    fullmatch = TOKEN_BATCH_PATTERN.fullmatch
+    return [
+        token is not None and fullmatch(token.strip()) is not None
+        for token in tokens
+    ]
+
+
 def validate_user_id(user_id: str) -> Tuple[bool, str]:
     """
     验证用户ID格式
     
+    同一用户ID的验证结果会被缓存
+    
     Args:
         user_id: 待验证的用户ID
         
@@ -81,15 +146,10 @@ def validate_user_id(user_id: str) -> Tuple[bool, str]:
     if user_id is None:
         return False, "用户ID不能为空"
     
-    if not user_id or not user_id.strip():
-        return False, "用户ID不能为空或纯空白"
-    
-    user_id = user_id.strip()
-    
-    if len(user_id) > 64:
-        return False, "用户ID长度不能超过64个字符"
+    if len(user_id) > _CACHEABLE_MAX_LENGTH:
+        return _validate_user_id_impl.__wrapped__(user_id)
     
-    return True, ""
+    return _validate_user_id_impl(user_id)
 
 
 def is_valid_user_id(user_id: str) -> bool:
@@ -104,3 +164,9 @@ def is_valid_user_id(user_id: str) -> bool:
     """
     valid, _ = validate_user_id(user_id)
     return valid
+
+
+def clear_validation_cache() -> None:
+    """清空验证结果缓存（主要用于测试）"""
+    _validate_token_impl.cache_clear()
+    _validate_user_id_impl.cache_clear()
@@ -9,39 +9,78 @@ WebSocket连接管理器模块
 """
 
 import asyncio
+import heapq
 import logging
+import time
 from datetime import datetime
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Iterable, Iterator, Tuple
 from dataclasses import dataclass, field
 
 from fastapi import WebSocket, WebSocketDisconnect
 
-from .config import WS_HEARTBEAT_INTERVAL, get_china_now
+from .config import WS_HEARTBEAT_INTERVAL, CHINA_TZ, get_china_now
+from .message_protocol import serialize_message
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 连接表分片数量（必须是2的幂），每个分片独立加锁
+WS_SHARD_COUNT = 16
 
-@dataclass
+# 单调时钟到Unix时间戳的偏移，仅用于把心跳时间换算成展示用的日期时间
+_MONOTONIC_TO_WALL = time.time() - time.monotonic()
+
+
+@dataclass(slots=True)
 class ConnectionInfo:
     """
     WebSocket连接信息
     
     存储单个插件连接的所有相关信息
+    
+    last_heartbeat是time.monotonic()时间戳，心跳检查只需做浮点减法；
+    需要展示时通过last_heartbeat_at换算为日期时间
+    
+    两个时间的ISO字符串会被缓存：connected_at的在创建时生成，
+    last_heartbeat的在首次读取时生成，心跳更新后再次读取才重新格式化
     """
     websocket: WebSocket
     extension_id: str
     user_id: Optional[str] = None
     connected_at: datetime = field(default_factory=get_china_now)
-    last_heartbeat: datetime = field(default_factory=get_china_now)
+    last_heartbeat: float = field(default_factory=time.monotonic)
+    _connected_at_iso: Optional[str] = field(init=False, repr=False, compare=False)
+    _heartbeat_iso_stamp: Optional[float] = field(default=None, init=False, repr=False, compare=False)
+    _heartbeat_iso: str = field(default="", init=False, repr=False, compare=False)
+    
+    def __post_init__(self) -> None:
+        self._connected_at_iso = self.connected_at.isoformat() if self.connected_at else None
+    
+    @property
+    def last_heartbeat_at(self) -> datetime:
+        """最后一次心跳的日期时间（东八区）"""
+        return datetime.fromtimestamp(self.last_heartbeat + _MONOTONIC_TO_WALL, CHINA_TZ)
+    
+    @property
+    def connected_at_iso(self) -> Optional[str]:
+        """连接建立时间的ISO字符串"""
+        return self._connected_at_iso
+    
+    @property
+    def last_heartbeat_iso(self) -> str:
+        """最后一次心跳时间的ISO字符串，心跳未变化时直接返回缓存"""
+        if self._heartbeat_iso_stamp != self.last_heartbeat:
+            self._heartbeat_iso = self.last_heartbeat_at.isoformat()
+            self._heartbeat_iso_stamp = self.last_heartbeat
+        return self._heartbeat_iso
     
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
             "extension_id": self.extension_id,
             "user_id": self.user_id,
-            "connected_at": self.connected_at.isoformat() if self.connected_at else None,
-            "last_heartbeat": self.last_heartbeat.isoformat() if self.last_heartbeat else None,
+            "connected_at": self._connected_at_iso,
+            "last_heartbeat": self.last_heartbeat_iso,
         }
 
 
@@ -54,6 +93,10 @@ class WebSocketManager:
     - 消息发送（定向/广播）
     - 心跳检测
     
+    连接表按extension_id哈希分为WS_SHARD_COUNT个分片，每个分片一把锁，
+    只有连接和断开等写操作持锁；读取单个字典项或对分片做list快照在事件循环中
+    不会被打断，发送、查询和心跳检查等读路径均不加锁
+    
     Requirements: 7.1, 7.2, 7.3, 7.4, 7.6
     """
     
@@ -64,19 +107,57 @@ class WebSocketManager:
         Args:
             heartbeat_interval: 心跳检测间隔（秒），默认从配置读取
         """
-        # 存储所有连接，key为extension_id
-        self._connections: Dict[str, ConnectionInfo] = {}
+        # 分片存储所有连接，key为extension_id
+        self._shards: List[Dict[str, ConnectionInfo]] = [{} for _ in range(WS_SHARD_COUNT)]
+        # 每个分片一把锁
+        self._shard_locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(WS_SHARD_COUNT)]
+        # 用户ID到连接的索引，set_user_id时建立，连接移除时清理
+        self._by_user: Dict[str, ConnectionInfo] = {}
+        # 按心跳时间排序的最小堆，元素为(last_heartbeat, extension_id)
+        # 每次心跳压入新条目，旧条目不主动删除，出堆时与连接当前的心跳时间比对
+        self._expiry_heap: List[Tuple[float, str]] = []
         # 心跳检测间隔
         self._heartbeat_interval = heartbeat_interval
         # 心跳检测任务
         self._heartbeat_task: Optional[asyncio.Task] = None
         # 运行状态
         self._running = False
-        # 锁，用于线程安全
-        self._lock = asyncio.Lock()
         
         logger.info(f"WebSocket管理器初始化完成, 心跳间隔={heartbeat_interval}秒")
     
+    def _shard_index(self, extension_id: str) -> int:
+        """计算插件所在的分片下标"""
+        return hash(extension_id) & (WS_SHARD_COUNT - 1)
+    
+    def _shard(self, extension_id: str) -> Dict[str, ConnectionInfo]:
+        """获取插件所在的分片"""
+        return self._shards[self._shard_index(extension_id)]
+    
+    def _iter_connections(self) -> Iterator[ConnectionInfo]:
+        """遍历所有分片中的连接（不加锁，调用方不得在遍历中await）"""
+        for shard in self._shards:
+            yield from shard.values()
+    
+    def _track_heartbeat(self, conn_info: ConnectionInfo) -> None:
+        """将连接当前的心跳时间压入过期堆"""
+        heapq.heappush(self._expiry_heap, (conn_info.last_heartbeat, conn_info.extension_id))
+    
+    def _unindex_user(self, conn_info: ConnectionInfo) -> None:
+        """
+        连接移除或更换用户时清理用户索引
+        
+        同一用户还有其他连接时，索引改指向其中一个
+        """
+        user_id = conn_info.user_id
+        if user_id is None or self._by_user.get(user_id) is not conn_info:
+            return
+        
+        del self._by_user[user_id]
+        for other in self._iter_connections():
+            if other.user_id == user_id and other is not conn_info:
+                self._by_user[user_id] = other
+                break
+    
     async def connect(self, websocket: WebSocket, extension_id: str) -> bool:
         """
         接受新的WebSocket连接
@@ -90,15 +171,18 @@ class WebSocketManager:
             
         Requirements: 7.1, 7.3
         """
-        async with self._lock:
+        index = self._shard_index(extension_id)
+        shard = self._shards[index]
+        async with self._shard_locks[index]:
             try:
                 # 接受WebSocket连接
                 await websocket.accept()
                 
                 # 检查是否已存在该插件的连接
-                if extension_id in self._connections:
+                if extension_id in shard:
                     # 关闭旧连接
-                    old_conn = self._connections[extension_id]
+                    old_conn = shard.pop(extension_id)
+                    self._unindex_user(old_conn)
                     try:
                         await old_conn.websocket.close(code=1000, reason="新连接替换")
                     except Exception:
@@ -110,19 +194,48 @@ class WebSocketManager:
                     websocket=websocket,
                     extension_id=extension_id,
                     connected_at=get_china_now(),
-                    last_heartbeat=get_china_now()
+                    last_heartbeat=time.monotonic()
                 )
                 
                 # 存储连接
-                self._connections[extension_id] = conn_info
+                shard[extension_id] = conn_info
+                self._track_heartbeat(conn_info)
                 
-                logger.info(f"新连接建立: extension_id={extension_id}, 当前连接数={len(self._connections)}")
+                logger.info(f"新连接建立: extension_id={extension_id}, 当前连接数={self.get_connection_count()}")
                 return True
                 
             except Exception as e:
                 logger.error(f"建立连接失败: extension_id={extension_id}, error={str(e)}")
                 return False
     
+    def register_accepted(self, websocket: WebSocket, extension_id: str) -> ConnectionInfo:
+        """
+        登记一个已accept的WebSocket连接
+        
+        用于端点自行accept并完成注册握手后的连接，同extension_id的旧记录会被覆盖
+        
+        Args:
+            websocket: 已accept的FastAPI WebSocket对象
+            extension_id: 插件唯一标识
+            
+        Returns:
+            ConnectionInfo: 新的连接信息
+        """
+        conn_info = ConnectionInfo(
+            websocket=websocket,
+            extension_id=extension_id,
+            connected_at=get_china_now(),
+            last_heartbeat=time.monotonic()
+        )
+        shard = self._shard(extension_id)
+        old_conn = shard.pop(extension_id, None)
+        if old_conn is not None:
+            self._unindex_user(old_conn)
+        shard[extension_id] = conn_info
+        self._track_heartbeat(conn_info)
+        logger.info(f"登记已接受的连接: extension_id={extension_id}, 当前连接数={self.get_connection_count()}")
+        return conn_info
+    
     async def disconnect(self, extension_id: str) -> bool:
         """
         断开指定插件的连接
@@ -135,21 +248,60 @@ class WebSocketManager:
             
         Requirements: 7.3
         """
-        async with self._lock:
-            if extension_id not in self._connections:
+        index = self._shard_index(extension_id)
+        shard = self._shards[index]
+        async with self._shard_locks[index]:
+            if extension_id not in shard:
                 logger.warning(f"断开连接失败: 连接不存在, extension_id={extension_id}")
                 return False
             
-            conn_info = self._connections.pop(extension_id)
+            conn_info = shard.pop(extension_id)
+            self._unindex_user(conn_info)
             
             try:
                 await conn_info.websocket.close(code=1000, reason="正常断开")
             except Exception as e:
                 logger.debug(f"关闭WebSocket时出错（可忽略）: {str(e)}")
             
-            logger.info(f"连接已断开: extension_id={extension_id}, 当前连接数={len(self._connections)}")
+            logger.info(f"连接已断开: extension_id={extension_id}, 当前连接数={self.get_connection_count()}")
             return True
     
+    async def _disconnect_many(self, extension_ids: Iterable[str], reason: str = "正常断开") -> int:
+        """
+        批量断开连接
+        
+        按分片分组，每个涉及的分片只加锁一次移除全部条目，
+        WebSocket的关闭在锁外并发进行
+        
+        Args:
+            extension_ids: 要断开的插件标识
+            reason: 关闭原因
+            
+        Returns:
+            int: 实际移除的连接数量
+        """
+        by_shard: Dict[int, List[str]] = {}
+        for ext_id in extension_ids:
+            by_shard.setdefault(self._shard_index(ext_id), []).append(ext_id)
+        
+        removed: List[ConnectionInfo] = []
+        for index, ext_ids in by_shard.items():
+            shard = self._shards[index]
+            async with self._shard_locks[index]:
+                for ext_id in ext_ids:
+                    conn_info = shard.pop(ext_id, None)
+                    if conn_info is not None:
+                        self._unindex_user(conn_info)
+                        removed.append(conn_info)
+        
+        if removed:
+            await asyncio.gather(
+                *[conn_info.websocket.close(code=1000, reason=reason) for conn_info in removed],
+                return_exceptions=True
+            )
+            logger.info(f"批量断开连接: 数量={len(removed)}, 当前连接数={self.get_connection_count()}")
+        return len(removed)
+    
     async def send_to_extension(self, extension_id: str, message: dict) -> bool:
         """
         向指定插件发送消息
@@ -163,16 +315,27 @@ class WebSocketManager:
             
         Requirements: 7.4
         """
-        async with self._lock:
-            if extension_id not in self._connections:
-                logger.warning(f"发送消息失败: 连接不存在, extension_id={extension_id}")
-                return False
+        return await self.send_text_to_extension(extension_id, serialize_message(message))
+    
+    async def send_text_to_extension(self, extension_id: str, text: str) -> bool:
+        """
+        向指定插件发送已序列化的消息
+        
+        Args:
+            extension_id: 目标插件标识
+            text: 已序列化的JSON字符串
             
-            conn_info = self._connections[extension_id]
+        Returns:
+            bool: 是否发送成功
+        """
+        conn_info = self._shard(extension_id).get(extension_id)
+        if conn_info is None:
+            logger.warning(f"发送消息失败: 连接不存在, extension_id={extension_id}")
+            return False
         
         try:
-            await conn_info.websocket.send_json(message)
-            logger.debug(f"消息已发送: extension_id={extension_id}, type={message.get('type', 'unknown')}")
+            await conn_info.websocket.send_text(text)
+            logger.debug(f"消息已发送: extension_id={extension_id}, length={len(text)}")
             return True
         except Exception as e:
             logger.error(f"发送消息失败: extension_id={extension_id}, error={str(e)}")
@@ -193,30 +356,37 @@ class WebSocketManager:
             
         Requirements: 7.4
         """
-        exclude = exclude or []
-        success_count = 0
-        failed_extensions = []
-        
-        # 获取所有需要发送的连接
-        async with self._lock:
+        # 快照需要发送的连接，构建过程中没有await，无需加锁
+        if exclude:
+            exclude_set = frozenset(exclude)
             targets = [
-                (ext_id, conn_info)
-                for ext_id, conn_info in self._connections.items()
-                if ext_id not in exclude
+                conn_info
+                for shard in self._shards
+                for ext_id, conn_info in shard.items()
+                if ext_id not in exclude_set
             ]
+        else:
+            targets = [conn_info for shard in self._shards for conn_info in shard.values()]
         
-        # 发送消息
-        for ext_id, conn_info in targets:
-            try:
-                await conn_info.websocket.send_json(message)
-                success_count += 1
-            except Exception as e:
-                logger.error(f"广播消息失败: extension_id={ext_id}, error={str(e)}")
-                failed_extensions.append(ext_id)
+        # 消息只序列化一次，所有连接共用同一帧
+        frame = serialize_message(message)
+        
+        # 并发发送，单个慢连接不拖慢整体广播
+        results = await asyncio.gather(
+            *[conn_info.websocket.send_text(frame) for conn_info in targets],
+            return_exceptions=True
+        )
+        
+        failed_extensions = []
+        for conn_info, result in zip(targets, results):
+            if isinstance(result, BaseException):
+                logger.error(f"广播消息失败: extension_id={conn_info.extension_id}, error={str(result)}")
+                failed_extensions.append(conn_info.extension_id)
+        success_count = len(targets) - len(failed_extensions)
         
         # 清理失败的连接
-        for ext_id in failed_extensions:
-            await self.disconnect(ext_id)
+        if failed_extensions:
+            await self._disconnect_many(failed_extensions)
         
         logger.info(f"广播完成: 成功={success_count}, 失败={len(failed_extensions)}, type={message.get('type', 'unknown')}")
         return success_count
@@ -233,10 +403,12 @@ class WebSocketManager:
             
         Requirements: 7.6
         """
-        if extension_id not in self._connections:
+        conn_info = self._shard(extension_id).get(extension_id)
+        if conn_info is None:
             return False
         
-        self._connections[extension_id].last_heartbeat = get_china_now()
+        conn_info.last_heartbeat = time.monotonic()
+        self._track_heartbeat(conn_info)
         logger.debug(f"心跳更新: extension_id={extension_id}")
         return True
     
@@ -251,10 +423,14 @@ class WebSocketManager:
         Returns:
             bool: 是否设置成功
         """
-        if extension_id not in self._connections:
+        conn_info = self._shard(extension_id).get(extension_id)
+        if conn_info is None:
             return False
         
-        self._connections[extension_id].user_id = user_id
+        if conn_info.user_id != user_id:
+            self._unindex_user(conn_info)
+        conn_info.user_id = user_id
+        self._by_user[user_id] = conn_info
         logger.info(f"关联用户: extension_id={extension_id}, user_id={user_id}")
         return True
     
@@ -268,7 +444,7 @@ class WebSocketManager:
         Returns:
             Optional[ConnectionInfo]: 连接信息，不存在则返回None
         """
-        return self._connections.get(extension_id)
+        return self._shard(extension_id).get(extension_id)
     
     def get_connection_by_user(self, user_id: str) -> Optional[ConnectionInfo]:
         """
@@ -280,10 +456,26 @@ class WebSocketManager:
         Returns:
             Optional[ConnectionInfo]: 连接信息，不存在则返回None
         """
-        for conn_info in self._connections.values():
-            if conn_info.user_id == user_id:
-                return conn_info
-        return None
+        return self._by_user.get(user_id)
+    
+    def get_connections_by_users(self, user_ids: Iterable[str]) -> Dict[str, ConnectionInfo]:
+        """
+        批量根据用户ID获取连接信息
+        
+        与get_connection_by_user一样走用户索引
+        
+        Args:
+            user_ids: 用户标识集合
+            
+        Returns:
+            Dict[str, ConnectionInfo]: 用户ID到连接信息的映射，未连接的用户不在其中
+        """
+        result: Dict[str, ConnectionInfo] = {}
+        for user_id in user_ids:
+            conn_info = self._by_user.get(user_id)
+            if conn_info is not None:
+                result[user_id] = conn_info
+        return result
     
     def get_all_connections(self) -> List[ConnectionInfo]:
         """
@@ -292,7 +484,7 @@ class WebSocketManager:
         Returns:
             List[ConnectionInfo]: 所有连接信息列表
         """
-        return list(self._connections.values())
+        return list(self._iter_connections())
     
     def get_connection_count(self) -> int:
         """
@@ -301,7 +493,7 @@ class WebSocketManager:
         Returns:
             int: 连接数量
         """
-        return len(self._connections)
+        return sum(len(shard) for shard in self._shards)
     
     def is_connected(self, extension_id: str) -> bool:
         """
@@ -313,7 +505,7 @@ class WebSocketManager:
         Returns:
             bool: 是否已连接
         """
-        return extension_id in self._connections
+        return extension_id in self._shard(extension_id)
 
     
     async def start_heartbeat_checker(self) -> None:
@@ -375,24 +567,28 @@ class WebSocketManager:
         """
         检查所有连接的心跳状态
         
+        只从过期堆中弹出已超时的条目，健康连接不会被逐个遍历；
+        连接已移除或之后又有心跳的条目直接丢弃
+        
         Args:
             timeout_threshold: 超时阈值（秒）
         """
-        now = get_china_now()
+        now = time.monotonic()
+        heap = self._expiry_heap
         expired_extensions = []
         
-        # 检查所有连接
-        async with self._lock:
-            for ext_id, conn_info in self._connections.items():
-                elapsed = (now - conn_info.last_heartbeat).total_seconds()
-                if elapsed > timeout_threshold:
-                    expired_extensions.append(ext_id)
-                    logger.warning(f"连接心跳超时: extension_id={ext_id}, elapsed={elapsed:.1f}秒")
+        while heap and now - heap[0][0] > timeout_threshold:
+            heartbeat, ext_id = heapq.heappop(heap)
+            conn_info = self._shard(ext_id).get(ext_id)
+            if conn_info is None or conn_info.last_heartbeat != heartbeat:
+                continue
+            expired_extensions.append(ext_id)
+            logger.warning(f"连接心跳超时: extension_id={ext_id}, elapsed={now - heartbeat:.1f}秒")
         
         # 断开超时的连接
-        for ext_id in expired_extensions:
-            await self.disconnect(ext_id)
-            logger.info(f"已断开超时连接: extension_id={ext_id}")
+        if expired_extensions:
+            count = await self._disconnect_many(expired_extensions, reason="心跳超时")
+            logger.info(f"已断开超时连接: 数量={count}")
     
     async def close_all(self) -> None:
         """
@@ -401,14 +597,17 @@ class WebSocketManager:
         # 停止心跳检测
         await self.stop_heartbeat_checker()
         
-        # 关闭所有连接
-        async with self._lock:
-            for ext_id, conn_info in list(self._connections.items()):
-                try:
-                    await conn_info.websocket.close(code=1001, reason="服务器关闭")
-                except Exception:
-                    pass
-            self._connections.clear()
+        # 逐个分片关闭所有连接
+        for shard, lock in zip(self._shards, self._shard_locks):
+            async with lock:
+                for conn_info in list(shard.values()):
+                    try:
+                        await conn_info.websocket.close(code=1001, reason="服务器关闭")
+                    except Exception:
+                        pass
+                shard.clear()
+        self._by_user.clear()
+        self._expiry_heap.clear()
         
         logger.info("所有WebSocket连接已关闭")
 
@@ -1,14 +1,28 @@
 """
 公共工具函数模块
 """
+from collections import Counter
+from operator import itemgetter
+
 from config import CITIES
 
+# 城市名 -> 在CITIES中的顺序（多个城市同时匹配时取靠前的，与逐个startswith一致）
+_CITY_ORDER = {city: index for index, city in reversed(list(enumerate(CITIES)))}
+# 城市名出现过的长度，按长度截取名称前缀后查表
+_CITY_LENGTHS = sorted({len(city) for city in CITIES})
+# 不参与城市统计的名称
+_EXCLUDED_CITIES = frozenset(("未知", "其他"))
+
 
 def extract_city(agent_name: str) -> str:
     """从加盟商名称提取城市"""
-    for city in CITIES:
-        if agent_name.startswith(city):
-            return city
+    matches = [
+        prefix
+        for prefix in (agent_name[:length] for length in _CITY_LENGTHS)
+        if prefix in _CITY_ORDER
+    ]
+    if matches:
+        return min(matches, key=_CITY_ORDER.__getitem__)
     return agent_name[:2] if len(agent_name) >= 2 else "未知"
 
 
@@ -22,29 +36,20 @@ def aggregate_by_city(agents: list) -> dict:
     Returns:
         dict: {城市名: {"volume": 总订单量, "count": 加盟商数量}}
     """
-    city_stats = {}
+    volumes = Counter()
+    counts = Counter()
     
     for agent in agents:
-        agent_name = agent.get("dimension", "")
-        order_count = agent.get("orderCount", 0) or 0
-        city = extract_city(agent_name)
-        
-        if city not in city_stats:
-            city_stats[city] = {"volume": 0, "count": 0}
-        
-        city_stats[city]["volume"] += order_count
-        city_stats[city]["count"] += 1
+        city = extract_city(agent.get("dimension", ""))
+        volumes[city] += agent.get("orderCount", 0) or 0
+        counts[city] += 1
     
     # 按订单量降序排序，排除"未知"和"其他"
-    sorted_stats = dict(
-        sorted(
-            [(k, v) for k, v in city_stats.items() if k not in ("未知", "其他")],
-            key=lambda x: x[1]["volume"],
-            reverse=True,
-        )
-    )
-    
-    return sorted_stats
+    return {
+        city: {"volume": volume, "count": counts[city]}
+        for city, volume in sorted(volumes.items(), key=itemgetter(1), reverse=True)
+        if city not in _EXCLUDED_CITIES
+    }
 
 
 def print_city_stats(city_stats: dict):